@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 
 from .forms import TagForm
-from .models import (Amount, Favorite, Follow, Ingredient, Recipe, Tag,
-                     TagRecipe, Trolley)
+from .models import (Amount, Favorite, Follow, Ingredient, Recipe, RecipeScore,
+                     ShoppingList, Tag, TagRecipe, TimelineEntry, Trolley)
+from .signals import refresh_recipe_indexes
 
 EMPTY = "-пусто-"
 
@@ -36,30 +38,98 @@ class RecipeAdmin(admin.ModelAdmin):
         "text",
         "cooking_time",
         "pub_date",
-        "in_favorite",
+        "favorites_count",
+        "carts_count",
         "get_tags",
     )
     search_fields = ("author__username", "name", "tags__tag__name")
     empty_value_display = EMPTY
 
-    def in_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
     def get_tags(self, obj):
         names = TagRecipe.objects.filter(recipe=obj).values_list("tag__name", flat=True)
         return ", ".join(names)
 
-    in_favorite.short_description = "Добавлено в избранные, раз"
     get_tags.short_description = "Тэги"
 
 
-class AmountAdmin(admin.ModelAdmin):
+class ShoppingListSyncMixin:
+    """
+    Пересчитывает списки покупок пользователей, затронутых изменением
+    записей в админке: API изменяет ShoppingList вместе с корзинами и
+    ингредиентами рецептов, а правки в админке идут мимо него.
+    shopping_list_user_lookup - путь ORM от записи к id пользователя, чей
+    список покупок от неё зависит.
+    """
+
+    shopping_list_user_lookup = "user"
+
+    def get_shopping_list_users(self, queryset):
+        """Id пользователей, чьи списки покупок зависят от записей queryset."""
+        lookup = self.shopping_list_user_lookup
+        return (
+            queryset.filter(**{f"{lookup}__isnull": False})
+            .order_by()
+            .values_list(lookup, flat=True)
+            .distinct()
+        )
+
+    def get_object_users(self, obj):
+        return set(self.get_shopping_list_users(self.model.objects.filter(pk=obj.pk)))
+
+    def rebuild_shopping_lists(self, users):
+        if users:
+            ShoppingList.objects.rebuild(users)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        # Пользователи до изменения: запись могла сменить рецепт или владельца.
+        users = self.get_object_users(obj) if change else set()
+        super().save_model(request, obj, form, change)
+        self.rebuild_shopping_lists(users | self.get_object_users(obj))
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        users = self.get_object_users(obj)
+        super().delete_model(request, obj)
+        self.rebuild_shopping_lists(users)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        users = set(self.get_shopping_list_users(queryset))
+        super().delete_queryset(request, queryset)
+        self.rebuild_shopping_lists(users)
+
+
+class RecipeIndexSyncMixin:
+    """
+    Обновляет в индексах в памяти рецепты записей, изменённых в админке:
+    сигналы обновляют индексы только при сохранении самого рецепта.
+    """
+
+    def refresh_recipes(self, queryset):
+        refresh_recipe_indexes(*set(queryset.values_list("recipe", flat=True)))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_recipe_indexes(obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_recipe_indexes(obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        self.refresh_recipes(queryset)
+        super().delete_queryset(request, queryset)
+
+
+class AmountAdmin(RecipeIndexSyncMixin, ShoppingListSyncMixin, admin.ModelAdmin):
     list_display = ("pk", "ingredient", "amount", "recipe")
     search_fields = ("ingredient",)
     empty_value_display = EMPTY
+    shopping_list_user_lookup = "recipe__trolley__user"
 
 
-class TagRecipeAdmin(admin.ModelAdmin):
+class TagRecipeAdmin(RecipeIndexSyncMixin, admin.ModelAdmin):
     list_display = ("pk", "tag", "recipe")
     search_fields = ("tag__name", "recipe__name")
     empty_value_display = EMPTY
@@ -70,7 +140,22 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "author__username")
 
 
-class TrolleyAdmin(admin.ModelAdmin):
+class TrolleyAdmin(ShoppingListSyncMixin, admin.ModelAdmin):
+    list_display = ("pk", "user", "recipe")
+    search_fields = ("user__username", "recipe__name")
+
+
+class ShoppingListAdmin(admin.ModelAdmin):
+    list_display = ("pk", "user", "ingredient", "amount")
+    search_fields = ("user__username", "ingredient__name")
+
+
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ("recipe", "score", "computed_at")
+    search_fields = ("recipe__name",)
+
+
+class TimelineEntryAdmin(admin.ModelAdmin):
     list_display = ("pk", "user", "recipe")
     search_fields = ("user__username", "recipe__name")
 
@@ -83,3 +168,6 @@ admin.site.register(TagRecipe, TagRecipeAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Favorite, SelectedAdmin)
 admin.site.register(Trolley, TrolleyAdmin)
+admin.site.register(ShoppingList, ShoppingListAdmin)
+admin.site.register(RecipeScore, RecipeScoreAdmin)
+admin.site.register(TimelineEntry, TimelineEntryAdmin)
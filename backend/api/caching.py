@@ -0,0 +1,134 @@
+from hashlib import md5
+from time import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import quote_etag
+from django.utils.http import parse_etags
+
+
+def get_cache():
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def version_key(name):
+    return f"reference:{name}:version"
+
+
+def get_version(name):
+    """
+    Текущая версия справочника name. Начальное значение берётся от времени,
+    чтобы после вытеснения ключа версии из кэша не вернуться к старой версии.
+    """
+    return get_cache().get_or_set(version_key(name), int(time() * 1000), None)
+
+
+def bump_version(name):
+    """Делает устаревшими все закэшированные ответы справочника name."""
+    cache = get_cache()
+    try:
+        cache.incr(version_key(name))
+    except ValueError:
+        cache.set(version_key(name), int(time() * 1000), None)
+
+
+class CachedListMixin:
+    """
+    Кэширует отрендеренный JSON списка справочника без параметров запроса.
+    Ключ содержит версию справочника, которую сигналы увеличивают при
+    изменении его записей, так что устаревшие ответы просто не читаются.
+    Ответ отдаётся с ETag, по If-None-Match возвращается 304.
+
+    В кэше по умолчанию (locmem) версия своя у каждого процесса, поэтому
+    ответ живёт не дольше REFERENCE_CACHE_TIMEOUT; для мгновенного сброса
+    во всех процессах нужен общий бэкенд кэша (Redis, Memcached).
+    """
+
+    cache_name = None
+
+    def get_cached_content(self, request, *args, **kwargs):
+        cache = get_cache()
+        key = f"reference:{self.cache_name}:{get_version(self.cache_name)}"
+        content = cache.get(key)
+        if content is None:
+            response = super().list(request, *args, **kwargs)
+            content = request.accepted_renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            )
+            cache.set(key, content, settings.REFERENCE_CACHE_TIMEOUT)
+        return content
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        content = self.get_cached_content(request, *args, **kwargs)
+        etag = quote_etag(md5(content).hexdigest())
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=request.accepted_media_type)
+        response["ETag"] = etag
+        return response
+
+
+def recipe_fragment_key(request, recipe, fields="*"):
+    """
+    Ключ общей для всех пользователей части данных рецепта. Содержит время
+    изменения рецепта, поэтому изменённый рецепт просто получает новый ключ,
+    адрес сайта, от которого зависит ссылка на изображение, и выбранные поля.
+    """
+    return (
+        f"recipe:{recipe.pk}:{recipe.updated_at.timestamp()}:"
+        f"{request.scheme}://{request.get_host()}:{fields}"
+    )
+
+
+def overlay_user_flags(fragment, recipe, followed_ids):
+    """Дополняет общие данные рецепта признаками текущего пользователя."""
+    data = fragment.copy()
+    for flag in ("is_favorited", "is_in_shopping_cart"):
+        if flag in data:
+            data[flag] = getattr(recipe, flag)
+    if "author" in data:
+        data["author"] = data["author"].copy()
+        data["author"]["is_subscribed"] = recipe.author_id in followed_ids
+    return data
+
+
+class RecipeFragmentMixin:
+    """
+    Сериализация рецептов через кэш общих частей: вложенные сериализаторы
+    (тэги, ингредиенты, автор) выполняются только для рецептов, которых нет
+    в кэше, признаки пользователя подставляются поверх закэшированных данных.
+    Вьюсет должен предоставлять get_prefetches(), get_followed_ids() и
+    get_fields_key() - выбранные поля ответа.
+    """
+
+    def serialize_recipes(self, recipes):
+        cache = caches[settings.RECIPE_CACHE_ALIAS]
+        fields = self.get_fields_key()
+        keys = {
+            recipe.pk: recipe_fragment_key(self.request, recipe, fields)
+            for recipe in recipes
+        }
+        fragments = cache.get_many(keys.values())
+        missed = [recipe for recipe in recipes if keys[recipe.pk] not in fragments]
+        if missed:
+            prefetch_related_objects(missed, *self.get_prefetches())
+            rendered = {
+                keys[recipe.pk]: data
+                for recipe, data in zip(
+                    missed, self.get_serializer(missed, many=True).data
+                )
+            }
+            cache.set_many(rendered, settings.RECIPE_CACHE_TIMEOUT)
+            fragments.update(rendered)
+        followed_ids = self.get_followed_ids()
+        return [
+            overlay_user_flags(fragments[keys[recipe.pk]], recipe, followed_ids)
+            for recipe in recipes
+        ]
@@ -0,0 +1,63 @@
+from calendar import timegm
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from .models import Follow
+
+
+def make_etag(*parts):
+    return quote_etag(md5(":".join(map(str, parts)).encode()).hexdigest())
+
+
+def followed_ids(user):
+    """Множество id авторов, на которых подписан пользователь."""
+    if user.is_anonymous:
+        return set()
+    return set(Follow.objects.filter(user=user).values_list("author_id", flat=True))
+
+
+def recipe_state(recipe, followed):
+    """
+    Всё, от чего зависит ответ по рецепту: время изменения рецепта (его
+    обновляют и изменения тэгов, ингредиентов и данных автора) и признаки
+    пользователя, у которых собственного времени изменения нет. Признаков
+    нет у рецептов, для которых поля признаков не выбраны в ?fields=.
+    """
+    return (
+        recipe.pk,
+        recipe.updated_at.isoformat(),
+        getattr(recipe, "is_favorited", None),
+        getattr(recipe, "is_in_shopping_cart", None),
+        recipe.author_id in followed,
+    )
+
+
+def recipes_etag(user, recipes, followed, *extra):
+    """ETag ответа по рецептам recipes для пользователя user."""
+    return make_etag(
+        user.pk, *extra, *(recipe_state(recipe, followed) for recipe in recipes)
+    )
+
+
+def last_modified(user, recipe):
+    """
+    Время изменения рецепта для Last-Modified. Отдаётся только анонимам:
+    признаки пользователя меняются без изменения времени рецепта.
+    """
+    if user.is_anonymous:
+        return timegm(recipe.updated_at.utctimetuple())
+    return None
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Ответ 304, если клиент прислал актуальные ETag или дату, иначе None."""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
@@ -0,0 +1,49 @@
+import csv
+import json
+
+from django.conf import settings
+
+from .pdf import PdfWriter
+
+TITLE = "Список необходимых покупок:"
+
+
+class Echo:
+    """Объект с интерфейсом файла, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def text_lines(rows):
+    """Строки списка покупок вида "1: мука, 200.00 г"."""
+    yield TITLE
+    for pos, (name, amount, unit) in enumerate(rows, start=1):
+        yield f"{pos}: {name}, {amount} {unit}"
+
+
+def export_txt(rows):
+    for line in text_lines(rows):
+        yield f"{line}\n"
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("name", "amount", "measurement_unit"))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    separator = ""
+    yield "["
+    for name, amount, unit in rows:
+        item = {"name": name, "amount": str(amount), "measurement_unit": unit}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ","
+    yield "]"
+
+
+def export_pdf(rows):
+    font_path = getattr(settings, "SHOPPING_CART_PDF_FONT", None)
+    return PdfWriter(font_path).stream(text_lines(rows))
@@ -1,10 +1,14 @@
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend, SearchFilter
 
 from users.models import User
 
+from .models import Favorite, TagRecipe, Trolley
+from .search import get_search_backend
+
 
 class RecipeFilter:
     """
@@ -41,30 +45,103 @@ class RecipeFilter:
     def get_tags(self, request):
         return self.getlist_param_value_views(request, "tags")
 
+    def filter_by_user_relation(self, request, queryset, model, value):
+        """
+        Оставляет рецепты, связанные (value=True) или не связанные
+        (value=False) с пользователем через модель model. Связь проверяется
+        полусоединением EXISTS / NOT EXISTS, строки рецептов не размножаются.
+        """
+        if value is None:
+            return queryset
+        if request.user.is_anonymous:
+            return queryset.none() if value else queryset
+        related = Exists(
+            model.objects.filter(user=request.user, recipe=OuterRef("pk"))
+        )
+        return queryset.filter(related if value else ~related)
+
     def filter_queryset(self, request, queryset, view):
         """
         Return a filtered queryset for Recipe model.
         """
-        is_favorited = self.get_is_favorited(request)
-        if is_favorited is not None:
-            if is_favorited:
-                queryset = queryset.filter(selected__user=request.user)
-            else:
-                queryset = queryset.filter(~Q(selected__user=request.user))
-        is_in_shopping_cart = self.get_is_in_shopping_cart(request)
-        if is_in_shopping_cart is not None:
-            if is_in_shopping_cart:
-                queryset = queryset.filter(trolley__user=request.user)
-            else:
-                queryset = queryset.filter(~Q(trolley__user=request.user))
+        queryset = self.filter_by_user_relation(
+            request, queryset, Favorite, self.get_is_favorited(request)
+        )
+        queryset = self.filter_by_user_relation(
+            request, queryset, Trolley, self.get_is_in_shopping_cart(request)
+        )
         author = self.get_author(request)
         if author:
             queryset = queryset.filter(author=author)
         tags = self.get_tags(request)
         if tags:
-            queryset = queryset.filter(tags__tag__slug__in=tags)
-        return queryset.order_by("-pk").distinct("pk")
+            queryset = queryset.filter(
+                pk__in=TagRecipe.objects.filter(tag__slug__in=tags).values("recipe")
+            )
+        return queryset.order_by("-pk")
 
 
 class NameSearchFilter(SearchFilter):
     search_param = "name"
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    Ранжированный поиск по параметру ?search= через api.search: на
+    PostgreSQL - полнотекстовый с русской морфологией и pg_trgm, на SQLite -
+    поиск подстрокой. Метод поиска бэкенда задаёт атрибут search_method.
+    """
+
+    search_param = "search"
+    search_method = None
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        backend = get_search_backend(queryset)
+        return getattr(backend, self.search_method)(queryset, query)
+
+
+class RecipeSearchFilter(FullTextSearchFilter):
+    search_method = "search_recipes"
+
+
+class IngredientSearchFilter(FullTextSearchFilter):
+    search_method = "search_ingredients"
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    """
+    Сортировка рецептов по ?ordering=: newest - сначала новые, quickest -
+    сначала быстрые в приготовлении, popular - по заранее посчитанной
+    популярности RecipeScore (см. команду recompute_popularity). Без
+    параметра или с неизвестным значением порядок не меняется. Курсорная
+    пагинация берёт порядок из get_ordering.
+    """
+
+    ordering_param = "ordering"
+    orderings = {
+        "newest": ("-pub_date", "-pk"),
+        "quickest": ("cooking_time", "-pk"),
+        "popular": ("-popularity", "-pk"),
+    }
+    default_ordering = ("-pk",)
+
+    def get_ordering_name(self, request):
+        name = request.query_params.get(self.ordering_param)
+        return name if name in self.orderings else None
+
+    def get_ordering(self, request, queryset, view):
+        name = self.get_ordering_name(request)
+        return self.orderings.get(name, self.default_ordering)
+
+    def filter_queryset(self, request, queryset, view):
+        name = self.get_ordering_name(request)
+        if name is None:
+            return queryset
+        if name == "popular":
+            queryset = queryset.annotate(
+                popularity=Coalesce(F("score__score"), Value(0.0))
+            )
+        return queryset.order_by(*self.orderings[name])
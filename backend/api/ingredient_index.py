@@ -0,0 +1,139 @@
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .memory_index import MemoryIndex
+from .models import Ingredient
+
+GRAM_SIZE = 3
+
+
+def fold(name):
+    return name.casefold()
+
+
+def grams(name):
+    """Все подстроки name длиной от 1 до GRAM_SIZE символов."""
+    return {
+        name[pos:pos + size]
+        for size in range(1, GRAM_SIZE + 1)
+        for pos in range(len(name) - size + 1)
+    }
+
+
+def entry(ingredient):
+    """Запись индекса: свёрнутое название и данные ингредиента для ответа."""
+    return (
+        fold(ingredient.name),
+        {
+            "id": ingredient.pk,
+            "name": ingredient.name,
+            "measurement_unit": ingredient.measurement_unit,
+        },
+    )
+
+
+class IngredientIndex(MemoryIndex):
+    """
+    Индекс названий ингредиентов в памяти процесса для автодополнения.
+    Обновляется сигналами сохранения и удаления ингредиентов и полностью
+    перестраивается не реже, чем раз в INGREDIENT_INDEX_TTL секунд
+    (изменения из других процессов), см. MemoryIndex.
+
+    Совпадения по началу названия находятся двоичным поиском в
+    отсортированном списке названий, совпадения по подстроке - пересечением
+    множеств по n-граммам длиной до GRAM_SIZE символов.
+    """
+
+    ttl_setting = "INGREDIENT_INDEX_TTL"
+
+    def is_available(self):
+        return getattr(settings, "INGREDIENT_INDEX_ENABLED", True)
+
+    def empty(self):
+        return {"items": None, "names": [], "grams": {}}
+
+    def load(self):
+        items, index = {}, {}
+        for ingredient in Ingredient.objects.order_by().iterator():
+            items[ingredient.pk] = entry(ingredient)
+            for gram in grams(items[ingredient.pk][0]):
+                index.setdefault(gram, set()).add(ingredient.pk)
+        names = sorted((name, pk) for pk, (name, _) in items.items())
+        return {"items": items, "names": names, "grams": index}
+
+    def read(self, pk):
+        return Ingredient.objects.filter(pk=pk).first()
+
+    def apply(self, pk, ingredient):
+        if ingredient is None:
+            self.remove(pk)
+        else:
+            self.add(ingredient)
+
+    def add(self, ingredient):
+        with self.lock:
+            if self.items is None:
+                return
+            self.remove(ingredient.pk)
+            self.items[ingredient.pk] = entry(ingredient)
+            name = self.items[ingredient.pk][0]
+            insort(self.names, (name, ingredient.pk))
+            for gram in grams(name):
+                self.grams.setdefault(gram, set()).add(ingredient.pk)
+
+    def remove(self, pk):
+        with self.lock:
+            if self.items is None:
+                return
+            item = self.items.pop(pk, None)
+            if item is None:
+                return
+            name = item[0]
+            del self.names[bisect_left(self.names, (name, pk))]
+            for gram in grams(name):
+                ids = self.grams[gram]
+                ids.discard(pk)
+                if not ids:
+                    del self.grams[gram]
+
+    def candidates(self, query):
+        """id ингредиентов, в названии которых есть подстрока query."""
+        if len(query) <= GRAM_SIZE:
+            return self.grams.get(query, set())
+        ids = None
+        for gram in {query[pos:pos + GRAM_SIZE] for pos in range(len(query) - 2)}:
+            found = self.grams.get(gram)
+            if not found:
+                return set()
+            ids = found if ids is None else ids & found
+        return {pk for pk in ids if query in self.items[pk][0]}
+
+    def search(self, query, limit=None):
+        """
+        Возвращает не более limit ингредиентов, содержащих query: сначала
+        начинающиеся с query, затем остальные, каждые по алфавиту.
+        """
+        if limit is None:
+            limit = getattr(settings, "INGREDIENT_SEARCH_LIMIT", 50)
+        query = fold(query)
+        self.ensure_built()
+        with self.lock:
+            result = []
+            start = bisect_left(self.names, (query,))
+            for name, pk in self.names[start:start + limit]:
+                if not name.startswith(query):
+                    break
+                result.append(pk)
+            if len(result) < limit:
+                prefix = set(result)
+                rest = sorted(
+                    (self.items[pk][0], pk)
+                    for pk in self.candidates(query)
+                    if pk not in prefix
+                )
+                result.extend(pk for _, pk in rest[:limit - len(result)])
+            return [self.items[pk][1] for pk in result]
+
+
+ingredient_index = IngredientIndex()
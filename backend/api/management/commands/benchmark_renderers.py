@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from functools import partial
+from timeit import repeat
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from api.renderers import FastJSONRenderer, orjson
+
+
+def recipe_page(recipes, ingredients):
+    """
+    Страница рецептов той же структуры, что и ответ RecipeSerializer:
+    количества DecimalField сериализатор отдаёт строками.
+    """
+    results = ReturnList(serializer=None)
+    for number in range(recipes):
+        results.append(
+            ReturnDict(
+                (
+                    ("id", number),
+                    (
+                        "tags",
+                        [
+                            OrderedDict(
+                                (
+                                    ("id", tag),
+                                    ("name", f"Тэг {tag}"),
+                                    ("color", "#E26C2D"),
+                                    ("slug", f"tag_{tag}"),
+                                )
+                            )
+                            for tag in range(3)
+                        ],
+                    ),
+                    (
+                        "author",
+                        OrderedDict(
+                            (
+                                ("email", f"author{number}@yandex.ru"),
+                                ("id", number % 10),
+                                ("username", f"author{number % 10}"),
+                                ("first_name", "Вася"),
+                                ("last_name", "Пупкин"),
+                                ("is_subscribed", number % 2 == 0),
+                            )
+                        ),
+                    ),
+                    (
+                        "ingredients",
+                        [
+                            OrderedDict(
+                                (
+                                    ("id", ingredient),
+                                    ("name", f"Ингредиент {ingredient}"),
+                                    ("measurement_unit", "г"),
+                                    ("amount", f"{(ingredient * 10 + 5) / 4:.2f}"),
+                                )
+                            )
+                            for ingredient in range(ingredients)
+                        ],
+                    ),
+                    ("is_favorited", number % 3 == 0),
+                    ("is_in_shopping_cart", number % 5 == 0),
+                    ("name", f"Рецепт {number}"),
+                    (
+                        "image",
+                        f"http://foodgram.example.org/media/Recipe/{number}.jpg",
+                    ),
+                    ("text", "Нарезать, смешать и запекать 40 минут. " * 5),
+                    ("cooking_time", 40),
+                ),
+                serializer=None,
+            )
+        )
+    return OrderedDict(
+        (
+            ("count", recipes * 10),
+            ("next", "http://foodgram.example.org/api/recipes/?page=2"),
+            ("previous", None),
+            ("results", results),
+        )
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время рендеринга страницы рецептов стандартным "
+        "JSONRenderer и FastJSONRenderer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipes", type=int, default=100, help="Рецептов на странице."
+        )
+        parser.add_argument(
+            "--ingredients", type=int, default=10, help="Ингредиентов в рецепте."
+        )
+        parser.add_argument(
+            "--number", type=int, default=50, help="Рендерингов в одном замере."
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Число замеров.")
+
+    def handle(self, *args, **options):
+        data = recipe_page(options["recipes"], options["ingredients"])
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson не установлен."))
+        results = {}
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            name = type(renderer).__name__
+            content = renderer.render(data, "application/json")
+            best = min(
+                repeat(
+                    partial(renderer.render, data, "application/json"),
+                    number=options["number"],
+                    repeat=options["repeat"],
+                )
+            )
+            results[name] = best / options["number"]
+            self.stdout.write(
+                f"{name}: {results[name] * 1000:.3f} мс, {len(content)} байт"
+            )
+        speedup = results["JSONRenderer"] / results["FastJSONRenderer"]
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: {speedup:.1f}x"))
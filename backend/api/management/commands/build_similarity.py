@@ -0,0 +1,26 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.similarity import similarity_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит матрицу признаков рецептов для похожих рецептов и сохраняет "
+        "её в SIMILAR_MATRIX_PATH. Запускается периодически, например из cron."
+    )
+
+    def handle(self, *args, **options):
+        if not similarity_index.is_available():
+            raise CommandError("Не установлены numpy и scipy.")
+        start = perf_counter()
+        matrix = similarity_index.save(settings.SIMILAR_MATRIX_PATH)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Матрица {matrix.shape[0]}x{matrix.shape[1]}, "
+                f"ненулевых {matrix.nnz}, {perf_counter() - start:.2f} с: "
+                f"{settings.SIMILAR_MATRIX_PATH}"
+            )
+        )
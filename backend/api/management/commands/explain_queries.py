@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+
+from rest_framework.request import Request
+
+from api.filters import RecipeFilter
+from api.models import Amount, Follow, Recipe, ShoppingList, Tag, TagRecipe
+from api.search import get_search_backend
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Выводит план выполнения (EXPLAIN ANALYZE) основных запросов API "
+        "для проверки использования индексов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            help="id пользователя, от имени которого строятся запросы.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=6,
+            help="Размер страницы рецептов.",
+        )
+        parser.add_argument(
+            "--no-analyze",
+            action="store_true",
+            help="Выводить план без выполнения запросов.",
+        )
+
+    def get_user(self, user_id):
+        if user_id is None:
+            user = User.objects.filter(trolley__isnull=False).first()
+            user = user or User.objects.order_by("pk").first()
+        else:
+            user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            raise CommandError("Пользователь не найден.")
+        return user
+
+    def filter_recipes(self, user, query_string):
+        """Применяет RecipeFilter к рецептам с заданными параметрами запроса."""
+        http_request = HttpRequest()
+        http_request.GET = QueryDict(query_string)
+        request = Request(http_request)
+        request.user = user
+        return RecipeFilter().filter_queryset(request, Recipe.objects.all(), None)
+
+    def get_queries(self, user, limit):
+        """Возвращает пары (название, queryset) основных запросов API."""
+        recipes = Recipe.objects.select_related("author").with_user_flags(user)
+        page = list(recipes.values_list("pk", flat=True)[:limit])
+        authors = User.objects.filter(following__user=user)
+        tags = "&".join(
+            f"tags={slug}" for slug in Tag.objects.values_list("slug", flat=True)[:2]
+        )
+        by_tags = self.filter_recipes(user, tags)
+        by_relations = self.filter_recipes(user, "is_favorited=1&is_in_shopping_cart=0")
+        all_recipes = Recipe.objects.all()
+        found = get_search_backend(all_recipes).search_recipes(all_recipes, "суп")
+        return (
+            ("Список рецептов с признаками пользователя", recipes[:limit]),
+            ("Фильтр рецептов по тэгам", by_tags[:limit]),
+            ("Фильтр рецептов по избранному и корзине", by_relations[:limit]),
+            ("Поиск рецептов", found[:limit]),
+            ("Лента подписок", recipes.feed(user).order_by("-pk")[:limit]),
+            (
+                "Рецепты автора",
+                recipes.filter(author=user).order_by("-pk")[:limit],
+            ),
+            (
+                "Тэги рецептов страницы",
+                TagRecipe.objects.select_related("tag")
+                .filter(recipe__in=page)
+                .order_by("tag__name"),
+            ),
+            (
+                "Ингредиенты рецептов страницы",
+                Amount.objects.select_related("ingredient")
+                .filter(recipe__in=page)
+                .order_by("ingredient__name"),
+            ),
+            (
+                "Подписки пользователя",
+                Follow.objects.filter(user=user).values_list("author_id", flat=True),
+            ),
+            (
+                "Авторы в подписках с числом рецептов",
+                authors[:limit],
+            ),
+            (
+                "Последние рецепты авторов в подписках",
+                Recipe.objects.latest_by_author(3).filter(author__in=authors),
+            ),
+            ("Список покупок", ShoppingList.objects.totals_for_user(user)),
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["user"])
+        analyze = connection.vendor == "postgresql" and not options["no_analyze"]
+        for title, queryset in self.get_queries(user, options["limit"]):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{title}:"))
+            self.stdout.write(str(queryset.query))
+            if analyze:
+                self.stdout.write(queryset.explain(analyze=True, buffers=True))
+            else:
+                self.stdout.write(queryset.explain())
+            self.stdout.write("")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ShoppingList
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает списки покупок с нуля по корзинам пользователей: "
+        "исправляет списки после изменения корзин и ингредиентов мимо API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            help="Id пользователя, можно указать несколько раз. По умолчанию все.",
+        )
+
+    def handle(self, *args, **options):
+        ShoppingList.objects.rebuild(options["users"])
+        self.stdout.write(self.style.SUCCESS("Списки покупок пересчитаны."))
@@ -0,0 +1,22 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from api.popularity import recompute_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает таблицу популярности рецептов для ?ordering=popular. "
+        "Запускается периодически, например из cron."
+    )
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        count = recompute_scores()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Популярность пересчитана: рецептов {count}, "
+                f"{perf_counter() - start:.2f} с"
+            )
+        )
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Favorite, Follow, Recipe, Trolley
+from users.models import User
+
+# Счётчик модели и связь, строки которой он считает.
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "carts_count", Trolley, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Follow, "author"),
+)
+
+
+def actual_count(related, field):
+    """Подзапрос числа строк related, ссылающихся полем field на запись."""
+    return Coalesce(
+        Subquery(
+            related.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики избранного и корзин рецептов, рецептов и "
+        "подписчиков пользователей и исправляет разошедшиеся с данными."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать число разошедшихся счётчиков.",
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related, related_field in COUNTERS:
+            with transaction.atomic():
+                actual = actual_count(related, related_field)
+                drifted = list(
+                    model.objects.annotate(actual=actual)
+                    .exclude(**{field: F("actual")})
+                    .values_list("pk", flat=True)
+                )
+                if drifted and not options["dry_run"]:
+                    model.objects.filter(pk__in=drifted).update(**{field: actual})
+            self.stdout.write(
+                f"{model._meta.label}.{field}: расхождений {len(drifted)}"
+            )
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("Счётчики пересчитаны."))
@@ -0,0 +1,141 @@
+from abc import ABC, abstractmethod
+from threading import Lock, RLock, Thread
+from time import monotonic, time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+class MemoryIndex(ABC):
+    """
+    Основа индексов в памяти процесса. Данные индекса строит из БД метод
+    load() без блокировок, готовые данные подменяют текущие под коротким
+    захватом lock, поэтому запросы не ждут перестройки. Индексы строятся
+    при запуске процесса (preload_indexes в wsgi.py), а если этого не было -
+    при первом запросе. Данные старше ttl_setting секунд перестраиваются в
+    фоновом потоке, запросы тем временем читают прежние.
+
+    Подкласс определяет empty(), load(), read() и apply(). Изменения
+    отдельных записей применяются к данным через update(pk, data) и
+    refresh(pk). Записи, изменённые во время перестройки, после неё
+    перечитываются ещё раз: load() мог прочитать их до изменения.
+    """
+
+    ttl_setting = None
+    instances = []
+
+    def __init__(self):
+        self.lock = RLock()
+        self.build_lock = Lock()
+        self.clear()
+        MemoryIndex.instances.append(self)
+
+    def is_available(self):
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.built_at = None
+            # Время изменения записей с прошлой перестройки, по id записи.
+            self.changed = {}
+            self.install(self.empty())
+
+    @abstractmethod
+    def empty(self):
+        """Данные пустого (не построенного) индекса: {атрибут: значение}."""
+
+    @abstractmethod
+    def load(self):
+        """Данные индекса из БД: {атрибут: значение}."""
+
+    def loaded_as_of(self, started):
+        """Время, по состоянию на которое load() прочитал данные."""
+        return started
+
+    @abstractmethod
+    def read(self, pk):
+        """Данные записи pk из БД для update()."""
+
+    @abstractmethod
+    def apply(self, pk, data):
+        """Применяет к данным индекса данные записи pk, вызывается под lock."""
+
+    def install(self, data):
+        with self.lock:
+            for name, value in data.items():
+                setattr(self, name, value)
+
+    def rebuild(self):
+        """Строит данные индекса и подменяет ими текущие, держит build_lock."""
+        started = time()
+        data = self.load()
+        with self.lock:
+            self.install(data)
+            self.built_at = monotonic()
+            as_of = self.loaded_as_of(started)
+            changed = [pk for pk, at in self.changed.items() if at >= as_of]
+            self.changed = {}
+        for pk in changed:
+            self.refresh(pk)
+
+    def build(self):
+        with self.build_lock:
+            self.rebuild()
+
+    def rebuild_in_background(self):
+        if not self.build_lock.acquire(blocking=False):
+            return
+        try:
+            self.rebuild()
+        finally:
+            self.build_lock.release()
+            connections.close_all()
+
+    def is_stale(self):
+        ttl = getattr(settings, self.ttl_setting, 300)
+        return monotonic() - self.built_at > ttl
+
+    def ensure_built(self):
+        """
+        Строит индекс, если он ещё не построен (параллельные запросы ждут
+        одного построения), и запускает фоновую перестройку устаревшего.
+        """
+        if self.built_at is None:
+            with self.build_lock:
+                if self.built_at is None:
+                    self.rebuild()
+        elif self.is_stale() and not self.build_lock.locked():
+            Thread(target=self.rebuild_in_background, daemon=True).start()
+
+    def update(self, pk, data):
+        """Применяет данные записи pk к построенному индексу."""
+        if self.built_at is None:
+            return
+        self.changed[pk] = time()
+        with self.lock:
+            if self.built_at is not None:
+                self.apply(pk, data)
+
+    def refresh(self, pk):
+        """Перечитывает из БД запись pk и обновляет её в индексе."""
+        if self.built_at is None:
+            return
+        self.changed[pk] = time()
+        self.update(pk, self.read(pk))
+
+
+def preload_indexes():
+    """
+    Строит индексы в памяти при запуске процесса, чтобы первый запрос не
+    ждал построения. Ошибка БД (например, до применения миграций) не мешает
+    запуску: индекс построится при первом запросе.
+    """
+    if not getattr(settings, "INDEX_PRELOAD", True):
+        return
+    for index in MemoryIndex.instances:
+        if not index.is_available():
+            continue
+        try:
+            index.build()
+        except DatabaseError:
+            index.clear()
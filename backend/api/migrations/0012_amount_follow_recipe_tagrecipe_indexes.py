@@ -0,0 +1,39 @@
+# Generated by Django 3.2.9 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_alter_recipe_name"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="amount",
+            index=models.Index(
+                fields=["recipe", "ingredient"],
+                include=("amount",),
+                name="amount_recipe_ingredient_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-id"], name="recipe_author_id_desc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tagrecipe",
+            index=models.Index(
+                fields=["recipe", "tag"], name="tagrecipe_recipe_tag_idx"
+            ),
+        ),
+    ]
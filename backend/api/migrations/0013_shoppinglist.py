@@ -0,0 +1,87 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    Amount = apps.get_model("api", "Amount")
+    ShoppingList = apps.get_model("api", "ShoppingList")
+    totals = (
+        Amount.objects.filter(recipe__trolley__isnull=False)
+        .order_by()
+        .values("recipe__trolley__user", "ingredient")
+        .annotate(total=Sum("amount"))
+        .values_list("recipe__trolley__user", "ingredient", "total")
+    )
+    ShoppingList.objects.bulk_create(
+        (
+            ShoppingList(user_id=user, ingredient_id=ingredient, amount=total)
+            for user, ingredient, total in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("api", "0012_amount_follow_recipe_tagrecipe_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingList",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=12, verbose_name="Количество"
+                    ),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_lists",
+                        to="api.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Список покупок",
+                "verbose_name_plural": "Списки покупок",
+                "ordering": ("user__username", "ingredient__name"),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="shoppinglist",
+            constraint=models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="ShoppingList_unique_user_ingredient_pair",
+            ),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
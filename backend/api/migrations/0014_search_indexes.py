@@ -0,0 +1,55 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:20
+
+from django.db import migrations
+
+# Выражения индексов совпадают с SQL, который строит api.search для
+# SearchVector(..., config="russian"), иначе планировщик их не использует.
+CREATE_SEARCH_INDEXES = """
+CREATE INDEX IF NOT EXISTS recipe_search_vector_idx ON api_recipe USING gin ((
+    setweight(to_tsvector('russian'::regconfig, COALESCE(name, '')), 'A')
+    || setweight(to_tsvector('russian'::regconfig, COALESCE(text, '')), 'B')
+));
+CREATE INDEX IF NOT EXISTS ingredient_search_vector_idx ON api_ingredient
+    USING gin ((to_tsvector('russian'::regconfig, COALESCE(name, ''))));
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx ON api_recipe
+            USING gin ((UPPER(name::text)) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx ON api_ingredient
+            USING gin ((UPPER(name::text)) gin_trgm_ops);
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm is not installed: substring search will not be used';
+END
+$$;
+"""
+
+DROP_SEARCH_INDEXES = """
+DROP INDEX IF EXISTS recipe_search_vector_idx;
+DROP INDEX IF EXISTS ingredient_search_vector_idx;
+DROP INDEX IF EXISTS recipe_name_trgm_idx;
+DROP INDEX IF EXISTS ingredient_name_trgm_idx;
+"""
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_SEARCH_INDEXES)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_SEARCH_INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_shoppinglist"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
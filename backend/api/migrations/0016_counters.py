@@ -0,0 +1,54 @@
+# Generated by Django 3.2.9 on 2026-10-18 13:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счётчик модели и связь, строки которой он считает.
+COUNTERS = (
+    (("api", "Recipe"), "favorites_count", ("api", "Favorite"), "recipe"),
+    (("api", "Recipe"), "carts_count", ("api", "Trolley"), "recipe"),
+    (("users", "User"), "recipes_count", ("api", "Recipe"), "author"),
+    (("users", "User"), "followers_count", ("api", "Follow"), "author"),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, related, related_field in COUNTERS:
+        related = apps.get_model(*related)
+        count = (
+            related.objects.filter(**{related_field: OuterRef("pk")})
+            .order_by()
+            .values(related_field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        apps.get_model(*model).objects.update(
+            **{field: Coalesce(Subquery(count), 0, output_field=IntegerField())}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_recipe_updated_at"),
+        ("users", "0004_user_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В корзинах, раз"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В избранном, раз"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.9 on 2026-10-18 14:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_counters"),
+    ]
+
+    operations = [
+        # Время уже существующих добавлений неизвестно, им ставится время
+        # миграции.
+        migrations.AddField(
+            model_name="favorite",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="trolley",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_desc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["cooking_time", "-id"], name="recipe_cooking_time_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="RecipeScore",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="score",
+                        serialize=False,
+                        to="api.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="Популярность")),
+                ("computed_at", models.DateTimeField(verbose_name="Дата расчёта")),
+            ],
+            options={
+                "verbose_name": "Популярность рецепта",
+                "verbose_name_plural": "Популярность рецептов",
+                "ordering": ("-score",),
+            },
+        ),
+    ]
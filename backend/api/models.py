@@ -1,9 +1,24 @@
-from django.db import models
-from django.db.models import F, Q
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import (BooleanField, Count, DecimalField, Exists, F,
+                              Max, OuterRef, Q, Subquery, Sum, Value)
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User
 
+from .units import canonical_unit, unit_factor
+
+
+def change_counter(queryset, field, delta):
+    """
+    Прибавляет delta к счётчику field записей queryset одним UPDATE с
+    F-выражением, без чтения и гонок между запросами. Счётчик не уходит
+    ниже нуля, даже если разошёлся с данными до запуска recount.
+    """
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
 
 class Tag(models.Model):
     """Модель содержит представление о тегах рецептов."""
@@ -51,6 +66,67 @@ class Ingredient(models.Model):
         return f"{self.name}, {self.measurement_unit}"
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов к рецептам с вычисляемыми полями для ответов API."""
+
+    def latest_by_author(self, limit=None):
+        """
+        Оставляет не более limit последних рецептов каждого автора. Отбор
+        выполняется коррелированным подзапросом с LIMIT в том же запросе,
+        поэтому предзагрузка рецептов страницы авторов остаётся одним запросом.
+        """
+        queryset = self.order_by("-pk")
+        if limit is None:
+            return queryset
+        latest = (
+            Recipe.objects.filter(author=OuterRef("author"))
+            .order_by("-pk")
+            .values("pk")[:limit]
+        )
+        return queryset.filter(pk__in=Subquery(latest))
+
+    def with_user_flags(self, user, flags=("is_favorited", "is_in_shopping_cart")):
+        """
+        Добавляет к каждому рецепту признаки flags (is_favorited,
+        is_in_shopping_cart) для пользователя user. Признаки вычисляются
+        подзапросами EXISTS в основном запросе, без запроса на каждый рецепт.
+        """
+        relations = {"is_favorited": Favorite, "is_in_shopping_cart": Trolley}
+        if user is None or user.is_anonymous:
+            annotations = {
+                flag: Value(False, output_field=BooleanField()) for flag in flags
+            }
+        else:
+            annotations = {
+                flag: Exists(
+                    relations[flag].objects.filter(user=user, recipe=OuterRef("pk"))
+                )
+                for flag in flags
+            }
+        return self.annotate(**annotations)
+
+    def touch(self):
+        """
+        Отмечает рецепты изменёнными: нужно при изменении связанных строк
+        (тэги, ингредиенты, автор), которые не сохраняют сам рецепт.
+        """
+        return self.update(updated_at=timezone.now())
+
+    def feed(self, user):
+        """
+        Рецепты авторов, на которых подписан user. Разосланные рецепты берутся
+        из ленты пользователя, остальные (авторов с большим числом подписчиков
+        и опубликованные до появления лент) - из подписок при чтении.
+        """
+        return self.filter(
+            Q(pk__in=TimelineEntry.objects.filter(user=user).values("recipe"))
+            | Q(
+                fanned_out=False,
+                author__in=Follow.objects.filter(user=user).values("author"),
+            )
+        )
+
+
 class Recipe(models.Model):
     """Модель содержит представление всех рецептов."""
 
@@ -80,11 +156,35 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name=_("Дата публикации"),
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_("Дата изменения"),
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name=_("В избранном, раз"), default=0, editable=False
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name=_("В корзинах, раз"), default=0, editable=False
+    )
+    fanned_out = models.BooleanField(
+        verbose_name=_("Разослан в ленты подписчиков"), default=False, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = _("Рецепт")
         verbose_name_plural = _("Рецепты")
         ordering = ("-pk",)
+        indexes = (
+            # Рецепты автора по убыванию id: фильтр author и recipes_limit.
+            models.Index(fields=("author", "-id"), name="recipe_author_id_desc_idx"),
+            # Сортировки ?ordering=newest и ?ordering=quickest.
+            models.Index(fields=("-pub_date", "-id"), name="recipe_pub_date_desc_idx"),
+            models.Index(
+                fields=("cooking_time", "-id"), name="recipe_cooking_time_idx"
+            ),
+        )
         constraints = (
             models.CheckConstraint(
                 check=Q(cooking_time__gte=1),
@@ -95,7 +195,21 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name[:25]
 
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding:
+            self.fanned_out = TimelineEntry.objects.can_fan_out(self.author_id)
+        super().save(*args, **kwargs)
+        if adding:
+            change_counter(User.objects.filter(pk=self.author_id), "recipes_count", 1)
+        if adding and self.fanned_out:
+            TimelineEntry.objects.fan_out(self)
+
+    @transaction.atomic
     def delete(self, *args, **kwargs):
+        # Списки покупок и счётчик рецептов автора изменяет сигнал pre_delete:
+        # он срабатывает и при каскадном удалении и удалении через QuerySet.
         self.image.delete()
         return super().delete(*args, **kwargs)
 
@@ -123,6 +237,10 @@ class TagRecipe(models.Model):
             "recipe__name",
             "tag__name",
         )
+        indexes = (
+            # Предзагрузка тэгов рецептов страницы без обращения к таблице.
+            models.Index(fields=("recipe", "tag"), name="tagrecipe_recipe_tag_idx"),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=("tag", "recipe"),
@@ -133,6 +251,31 @@ class TagRecipe(models.Model):
     def __str__(self):
         return f"{self.id}: {self.recipe.name}, {self.tag.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Recipe.objects.filter(pk=self.recipe_id).touch()
+
+    def delete(self, *args, **kwargs):
+        Recipe.objects.filter(pk=self.recipe_id).touch()
+        return super().delete(*args, **kwargs)
+
+
+class AmountQuerySet(models.QuerySet):
+    """Набор запросов к количествам ингредиентов рецептов."""
+
+    def totals(self, *recipes):
+        """
+        Возвращает словарь {id ингредиента: количество} суммарно по рецептам
+        recipes.
+        """
+        return dict(
+            self.filter(recipe__in=recipes)
+            .order_by()
+            .values("ingredient")
+            .annotate(total=Sum("amount"))
+            .values_list("ingredient", "total")
+        )
+
 
 class Amount(models.Model):
     """Модель связывает рецепты с ингредиентами и их количеством."""
@@ -156,10 +299,20 @@ class Amount(models.Model):
         related_name=_("ingredients"),
     )
 
+    objects = AmountQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Количество")
         verbose_name_plural = _("Количество")
         ordering = ("recipe__name", "ingredient__name")
+        indexes = (
+            # Предзагрузка ингредиентов и суммирование списка покупок.
+            models.Index(
+                fields=("recipe", "ingredient"),
+                include=("amount",),
+                name="amount_recipe_ingredient_idx",
+            ),
+        )
         constraints = (
             models.CheckConstraint(
                 check=Q(amount__gt=0),
@@ -173,6 +326,14 @@ class Amount(models.Model):
             f"{self.ingredient.measurement_unit}"
         )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Recipe.objects.filter(pk=self.recipe_id).touch()
+
+    def delete(self, *args, **kwargs):
+        Recipe.objects.filter(pk=self.recipe_id).touch()
+        return super().delete(*args, **kwargs)
+
 
 class Favorite(models.Model):
     """Модель связывает пользователей и их любимые рецепты."""
@@ -189,6 +350,10 @@ class Favorite(models.Model):
         verbose_name=_("Рецепт"),
         related_name="selected",
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Дата добавления"),
+    )
 
     class Meta:
         verbose_name = _("Избранный рецепт")
@@ -225,6 +390,10 @@ class Follow(models.Model):
         verbose_name = _("Подписка на автора")
         verbose_name_plural = _("Подписки на авторов")
         ordering = ("user__username", "author__username")
+        indexes = (
+            # Подписчики автора, пара (user, author) покрыта ограничением.
+            models.Index(fields=("author", "user"), name="follow_author_user_idx"),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=("user", "author"),
@@ -255,6 +424,10 @@ class Trolley(models.Model):
         verbose_name=_("Рецепт"),
         related_name="trolley",
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_("Дата добавления"),
+    )
 
     class Meta:
         verbose_name = _("Корзина")
@@ -269,3 +442,287 @@ class Trolley(models.Model):
 
     def __str__(self):
         return f"{self.pk}: {self.user}, {self.recipe}"
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """
+    Набор запросов к спискам покупок. Списки хранят готовые суммы
+    ингредиентов рецептов из корзины и изменяются на разницу количеств при
+    изменении корзины или ингредиентов рецептов.
+    """
+
+    def totals_for_user(self, user):
+        """
+        Список покупок пользователя со сложенными количествами одноимённых
+        ингредиентов в разных единицах одной величины ("мука, г" и "мука, кг").
+        Количества переводятся в основные единицы таблицы api.units.UNITS и
+        суммируются одним запросом с группировкой по названию и основной
+        единице. Строки (название, сумма в основной единице, основная единица,
+        число исходных единиц, сумма без перевода, исходная единица), для
+        вывода их переводит api.units.humanize_rows.
+        """
+        unit = "ingredient__measurement_unit"
+        return (
+            self.filter(user=user)
+            .values(name=F("ingredient__name"), unit=canonical_unit(unit))
+            .annotate(
+                total=Sum(
+                    F("amount") * unit_factor(unit),
+                    output_field=DecimalField(max_digits=20, decimal_places=5),
+                ),
+                units=Count(unit, distinct=True),
+                source_amount=Sum("amount"),
+                source_unit=Max(unit),
+            )
+            .order_by("name", "unit")
+            .values_list(
+                "name", "total", "unit", "units", "source_amount", "source_unit"
+            )
+        )
+
+    def apply(self, deltas):
+        """
+        Прибавляет к спискам покупок изменения deltas вида
+        {(id пользователя, id ингредиента): количество}. Строки изменяются
+        запросом INSERT ... ON CONFLICT DO UPDATE: одновременные изменения
+        одной ещё не существующей строки складываются базой, а не падают на
+        ограничении уникальности. Строки с нулевым остатком удаляются.
+        """
+        # Строки изменяются в одном порядке, чтобы встречные транзакции не
+        # блокировали друг друга.
+        deltas = sorted((key, delta) for key, delta in deltas.items() if delta)
+        if not deltas:
+            return
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        user, ingredient, amount = (
+            quote(self.model._meta.get_field(name).column)
+            for name in ("user", "ingredient", "amount")
+        )
+        batch_size = connection.ops.bulk_batch_size(
+            ("user", "ingredient", "amount"), deltas
+        )
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            for start in range(0, len(deltas), batch_size):
+                batch = deltas[start:start + batch_size]
+                cursor.execute(
+                    f"INSERT INTO {table} ({user}, {ingredient}, {amount}) "
+                    f"VALUES {', '.join(['(%s, %s, %s)'] * len(batch))} "
+                    f"ON CONFLICT ({user}, {ingredient}) DO UPDATE "
+                    f"SET {amount} = {table}.{amount} + EXCLUDED.{amount}",
+                    [value for key, delta in batch for value in (*key, delta)],
+                )
+            self.filter(
+                user__in={user for (user, _), _ in deltas}, amount__lte=0
+            ).delete()
+
+    def add_recipe(self, user, recipe, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта."""
+        self.add_recipes(user, (recipe,), sign)
+
+    def add_recipes(self, user, recipes, sign=1):
+        """
+        Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов одним
+        запросом количеств.
+        """
+        if not recipes:
+            return
+        self.apply(
+            {
+                (user.pk, ingredient): sign * amount
+                for ingredient, amount in Amount.objects.totals(*recipes).items()
+            }
+        )
+
+    def change_recipe(self, recipe, old, new):
+        """
+        Переносит изменение ингредиентов рецепта old -> new в списки покупок
+        всех пользователей, у которых рецепт находится в корзине.
+        """
+        changes = {
+            ingredient: new.get(ingredient, 0) - old.get(ingredient, 0)
+            for ingredient in old.keys() | new.keys()
+        }
+        users = Trolley.objects.filter(recipe=recipe).values_list("user", flat=True)
+        self.apply(
+            {
+                (user, ingredient): delta
+                for user in users
+                for ingredient, delta in changes.items()
+            }
+        )
+
+    @transaction.atomic
+    def rebuild(self, users=None):
+        """Пересчитывает списки покупок пользователей users (всех) с нуля."""
+        # Условие на корзину задаётся одним filter(): второй filter() по
+        # той же связи добавил бы ещё одно соединение и размножил строки.
+        condition = {"recipe__trolley__isnull": False}
+        lists = self.all()
+        if users is not None:
+            condition = {"recipe__trolley__user__in": users}
+            lists = lists.filter(user__in=users)
+        amounts = Amount.objects.filter(**condition)
+        lists.delete()
+        totals = (
+            amounts.order_by()
+            .values("recipe__trolley__user", "ingredient")
+            .annotate(total=Sum("amount"))
+            .values_list("recipe__trolley__user", "ingredient", "total")
+        )
+        self.bulk_create(
+            (
+                ShoppingList(user_id=user, ingredient_id=ingredient, amount=total)
+                for user, ingredient, total in totals.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class ShoppingList(models.Model):
+    """
+    Модель содержит суммарное количество каждого ингредиента рецептов из
+    корзины пользователя.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name=_("Пользователь"),
+        related_name="shopping_list",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name=_("Ингредиент"),
+        related_name="shopping_lists",
+    )
+    amount = models.DecimalField(
+        verbose_name=_("Количество"),
+        max_digits=12,
+        decimal_places=2,
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Список покупок")
+        verbose_name_plural = _("Списки покупок")
+        ordering = ("user__username", "ingredient__name")
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name=_("ShoppingList_unique_user_ingredient_pair"),
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient}, {self.amount}"
+
+
+class RecipeScore(models.Model):
+    """
+    Популярность рецепта: добавления в избранное и в корзины с затуханием
+    по времени. Таблицу целиком пересчитывает команда recompute_popularity,
+    рецепты без добавлений в ней не хранятся.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name=_("Рецепт"),
+        related_name="score",
+    )
+    score = models.FloatField(verbose_name=_("Популярность"))
+    computed_at = models.DateTimeField(verbose_name=_("Дата расчёта"))
+
+    class Meta:
+        verbose_name = _("Популярность рецепта")
+        verbose_name_plural = _("Популярность рецептов")
+        ordering = ("-score",)
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.score:.3f}"
+
+
+class TimelineQuerySet(models.QuerySet):
+    """Набор запросов к лентам рецептов подписчиков."""
+
+    batch_size = 1000
+
+    def can_fan_out(self, author):
+        """
+        Рассылать ли рецепты автора по лентам при публикации: у авторов с
+        числом подписчиков больше FEED_FANOUT_LIMIT лента читает рецепты из
+        подписок, чтобы публикация не писала строку каждому подписчику.
+        """
+        followers = (
+            User.objects.filter(pk=author)
+            .values_list("followers_count", flat=True)
+            .first()
+        )
+        return followers is not None and followers <= settings.FEED_FANOUT_LIMIT
+
+    def fan_out(self, recipe):
+        """Добавляет рецепт в ленты всех подписчиков автора пачками."""
+        users = Follow.objects.filter(author=recipe.author_id).values_list(
+            "user", flat=True
+        )
+        self.bulk_create(
+            (TimelineEntry(user_id=user, recipe=recipe) for user in users.iterator()),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def follow(self, user, author):
+        """Добавляет в ленту нового подписчика разосланные рецепты автора."""
+        recipes = Recipe.objects.filter(author=author, fanned_out=True).values_list(
+            "pk", flat=True
+        )
+        self.bulk_create(
+            (TimelineEntry(user=user, recipe_id=pk) for pk in recipes.iterator()),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def unfollow(self, user, author):
+        """Убирает рецепты автора из ленты отписавшегося пользователя."""
+        return self.filter(user=user, recipe__author=author).delete()
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписчика автора. Строки создаются при публикации
+    рецепта для всех подписчиков автора сразу (fan-out on write).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name=_("Пользователь"),
+        related_name="timeline",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name=_("Рецепт"),
+        related_name="timeline",
+    )
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Запись ленты")
+        verbose_name_plural = _("Ленты подписок")
+        ordering = ("user", "-recipe")
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name=_("TimelineEntry_unique_user_recipe_pair"),
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.user} <- {self.recipe}"
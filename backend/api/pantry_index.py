@@ -0,0 +1,111 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nlargest
+
+from django.conf import settings
+
+from .memory_index import MemoryIndex
+from .models import Amount
+
+
+class PantryIndex(MemoryIndex):
+    """
+    Обратный индекс ингредиентов в памяти процесса для поиска рецептов по
+    продуктам в наличии: для каждого ингредиента - отсортированный массив
+    id рецептов с ним, для каждого рецепта - кортеж id его ингредиентов.
+    Строится из БД одним запросом, после сохранения или удаления рецепта
+    обновляется только этот рецепт и полностью перестраивается не реже,
+    чем раз в PANTRY_INDEX_TTL секунд (изменения из других процессов), см.
+    MemoryIndex.
+    """
+
+    ttl_setting = "PANTRY_INDEX_TTL"
+
+    def empty(self):
+        return {"recipes": None, "postings": {}}
+
+    def load(self):
+        rows = (
+            # Сортировка по id: order_by("recipe") сортировал бы по
+            # Recipe.Meta.ordering, то есть по убыванию id.
+            Amount.objects.order_by("recipe_id", "ingredient_id")
+            .values_list("recipe", "ingredient")
+            .distinct()
+        )
+        recipes, postings = {}, {}
+        for recipe, ingredient in rows.iterator():
+            recipes.setdefault(recipe, []).append(ingredient)
+            # Строки идут по возрастанию id рецепта, массивы уже отсортированы.
+            postings.setdefault(ingredient, array("q")).append(recipe)
+        return {
+            "recipes": {pk: tuple(ids) for pk, ids in recipes.items()},
+            "postings": postings,
+        }
+
+    def remove(self, pk):
+        with self.lock:
+            if self.recipes is None:
+                return
+            for ingredient in self.recipes.pop(pk, ()):
+                recipes = self.postings[ingredient]
+                del recipes[bisect_left(recipes, pk)]
+                if not recipes:
+                    del self.postings[ingredient]
+
+    def read(self, pk):
+        """id ингредиентов рецепта pk, у удалённого рецепта - пустой кортеж."""
+        return tuple(
+            Amount.objects.filter(recipe=pk)
+            .order_by("ingredient_id")
+            .values_list("ingredient", flat=True)
+            .distinct()
+        )
+
+    def apply(self, pk, ingredients):
+        self.remove(pk)
+        if not ingredients:
+            return
+        self.recipes[pk] = ingredients
+        for ingredient in ingredients:
+            insort(self.postings.setdefault(ingredient, array("q")), pk)
+
+    def search(self, ingredients, limit=None):
+        """
+        Рецепты, в которых есть хотя бы один из ингредиентов ingredients, в
+        порядке убывания покрытия - доли ингредиентов рецепта, которые есть в
+        наличии. Возвращает не более limit кортежей (id рецепта, покрытие,
+        id недостающих ингредиентов).
+        """
+        if limit is None:
+            limit = getattr(settings, "PANTRY_RESULTS_LIMIT", 20)
+        pantry = set(ingredients)
+        self.ensure_built()
+        with self.lock:
+            hits = Counter()
+            for ingredient in pantry:
+                hits.update(self.postings.get(ingredient, ()))
+            best = nlargest(
+                limit,
+                hits.items(),
+                key=lambda item: (
+                    item[1] / len(self.recipes[item[0]]),
+                    item[1],
+                    item[0],
+                ),
+            )
+            return [
+                (
+                    pk,
+                    count / len(self.recipes[pk]),
+                    [
+                        ingredient
+                        for ingredient in self.recipes[pk]
+                        if ingredient not in pantry
+                    ],
+                )
+                for pk, count in best
+            ]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,85 @@
+import os
+from functools import lru_cache
+from io import BytesIO
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen.canvas import Canvas
+except ImportError:  # pragma: no cover
+    Canvas = None
+
+MARGIN = 50
+FONT_SIZE = 11
+LEADING = 16
+# Символ, по которому проверяется наличие кириллицы в шрифте.
+CYRILLIC_SAMPLE = "ж"
+
+
+class PdfUnavailableError(Exception):
+    """Выгрузка в PDF невозможна: нет reportlab или шрифта с кириллицей."""
+
+
+@lru_cache(maxsize=4)
+def load_font(path):
+    """
+    Регистрирует в reportlab шрифт TrueType из файла path и возвращает его
+    имя. Файл читается один раз на процесс, в документ reportlab встраивает
+    только подмножество использованных глифов.
+    """
+    if Canvas is None:
+        raise PdfUnavailableError("Выгрузка в PDF недоступна: не установлен reportlab.")
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        font = TTFont(name, path)
+    except (OSError, TTFError) as error:
+        raise PdfUnavailableError(
+            f"Выгрузка в PDF недоступна: не удалось загрузить шрифт {path}."
+        ) from error
+    if ord(CYRILLIC_SAMPLE) not in font.face.charToGlyph:
+        raise PdfUnavailableError(
+            f"Выгрузка в PDF недоступна: шрифт {path} не содержит кириллицы."
+        )
+    pdfmetrics.registerFont(font)
+    return name
+
+
+class PdfWriter:
+    """
+    Текстовый PDF документ A4 шрифтом из файла font_path. Длинные строки
+    переносятся по ширине страницы, страницы добавляются по мере
+    заполнения. Без шрифта с кириллицей конструктор вызывает PdfUnavailableError,
+    до начала выгрузки, а не подставляет "?" вместо букв.
+    """
+
+    def __init__(self, font_path):
+        if not font_path:
+            raise PdfUnavailableError("Выгрузка в PDF недоступна: не задан шрифт.")
+        self.font = load_font(font_path)
+
+    def new_page(self, canvas):
+        """Задаёт шрифт новой страницы, возвращает высоту первой строки."""
+        canvas.setFont(self.font, FONT_SIZE)
+        return A4[1] - MARGIN
+
+    def stream(self, lines):
+        """
+        Генерирует байты PDF документа из итератора строк текста. reportlab
+        собирает документ целиком, поэтому он отдаётся после последней
+        строки.
+        """
+        output = BytesIO()
+        canvas = Canvas(output, pagesize=A4, pageCompression=1)
+        width = A4[0] - 2 * MARGIN
+        top = self.new_page(canvas)
+        for line in lines:
+            for part in simpleSplit(line, self.font, FONT_SIZE, width) or [""]:
+                if top < MARGIN:
+                    canvas.showPage()
+                    top = self.new_page(canvas)
+                canvas.drawString(MARGIN, top, part)
+                top -= LEADING
+        canvas.save()
+        yield output.getvalue()
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import (DateTimeField, FloatField, Func, OuterRef,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Coalesce, Power
+from django.utils import timezone
+
+from .models import Favorite, Recipe, RecipeScore, Trolley
+
+
+class AgeSeconds(Func):
+    """Возраст в секундах на момент now значения выражения-даты."""
+
+    arg_joiner = " - "
+    template = "EXTRACT(EPOCH FROM (%(expressions)s))"
+    output_field = FloatField()
+
+    def __init__(self, expression, now, **extra):
+        super().__init__(
+            Value(now, output_field=DateTimeField()), expression, **extra
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="((julianday(%(expressions)s)) * 86400.0)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+
+def decayed_count(model, weight, now):
+    """
+    Сумма добавлений рецепта в model, каждое весом weight, убывающим вдвое
+    за POPULARITY_HALF_LIFE_DAYS дней с момента добавления.
+    """
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 86400.0
+    decay = Power(Value(0.5), AgeSeconds("created_at", now) / Value(half_life))
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(total=Sum(Value(weight) * decay, output_field=FloatField()))
+            .values("total")
+        ),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def scores(now):
+    """Запрос (id рецепта, популярность, now) по рецептам с добавлениями."""
+    return (
+        Recipe.objects.order_by()
+        .annotate(
+            popularity=decayed_count(
+                Favorite, settings.POPULARITY_FAVORITE_WEIGHT, now
+            )
+            + decayed_count(Trolley, settings.POPULARITY_CART_WEIGHT, now),
+            computed_at=Value(now, output_field=DateTimeField()),
+        )
+        .filter(popularity__gt=0)
+        .values_list("pk", "popularity", "computed_at")
+    )
+
+
+@transaction.atomic
+def recompute_scores(now=None):
+    """
+    Пересчитывает таблицу популярности одним INSERT ... SELECT: суммы по
+    избранному и корзинам считаются в БД, строки не проходят через Python.
+    Старые оценки удаляются в той же транзакции, читатели видят их до
+    фиксации. Возвращает число рецептов с оценкой.
+    """
+    now = now or timezone.now()
+    alias = router.db_for_write(RecipeScore)
+    sql, params = scores(now).query.get_compiler(alias).as_sql()
+    RecipeScore.objects.using(alias).all().delete()
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {RecipeScore._meta.db_table} "
+            f"(recipe_id, score, computed_at) {sql}",
+            params,
+        )
+        return cursor.rowcount
@@ -0,0 +1,89 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .exporters import export_csv, export_json, export_pdf, export_txt
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson. Типы, которых нет в orjson (Decimal, ленивые
+    строки перевода, QuerySet), а также даты и время преобразуются тем же
+    JSONEncoder, что и в DRF, поэтому ответ совпадает со стандартным.
+    Без orjson, с отступами (indent) и при UNICODE_JSON или COMPACT_JSON,
+    выключенных в настройках, используется стандартный JSONRenderer.
+    """
+
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+    )
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        ret = orjson.dumps(data, default=self.encoder.default, option=self.options)
+        # Как и JSONRenderer, экранирую U+2028 и U+2029 для JavaScript.
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class ShoppingCartRenderer(JSONRenderer):
+    """
+    Формат выгрузки списка покупок. Выбирается параметром format или
+    заголовком Accept, сама выгрузка выполняется функцией exporter, а
+    рендерер выводит только ответы с ошибками.
+    """
+
+    exporter = None
+
+    def get_content_type(self):
+        if self.charset:
+            return f"{self.media_type}; charset={self.charset}"
+        return self.media_type
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+    exporter = staticmethod(export_txt)
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+    exporter = staticmethod(export_csv)
+
+
+class JSONShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = "application/json"
+    format = "json"
+    exporter = staticmethod(export_json)
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    exporter = staticmethod(export_pdf)
+
+
+SHOPPING_CART_RENDERERS = (
+    TextShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    JSONShoppingCartRenderer,
+    PDFShoppingCartRenderer,
+)
@@ -0,0 +1,108 @@
+from functools import lru_cache
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+SEARCH_CONFIG = "russian"
+
+
+@lru_cache(maxsize=None)
+def has_trigram_extension(alias):
+    """Проверяет, установлено ли расширение pg_trgm в базе alias."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def starts_with(field, query):
+    """Сортировочный признак: 0, если поле начинается с query, иначе 1."""
+    return Case(
+        When(**{f"{field}__istartswith": query}, then=Value(0)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+
+
+def contains(fields, query):
+    """
+    Условие вхождения query в одно из полей без учёта регистра. SQLite
+    сравнивает без учёта регистра только латиницу, поэтому дополнительно
+    проверяются варианты написания query в разных регистрах.
+    """
+    condition = Q()
+    for variant in {query, query.lower(), query.upper(), query.capitalize()}:
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": variant})
+    return condition
+
+
+class SearchBackend:
+    """
+    Переносимый поиск подстрокой через icontains: используется на SQLite
+    при локальном запуске тестов.
+    """
+
+    def search_recipes(self, queryset, query):
+        return queryset.filter(contains(("name", "text"), query)).order_by(
+            starts_with("name", query), "-pk"
+        )
+
+    def search_ingredients(self, queryset, query):
+        return queryset.filter(contains(("name",), query)).order_by(
+            starts_with("name", query), "name"
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Полнотекстовый поиск PostgreSQL с русской морфологией. Выражения
+    SearchVector совпадают с функциональными GIN индексами миграции 0014,
+    поэтому условие @@ выполняется по индексу. Если установлено расширение
+    pg_trgm, дополнительно ищутся вхождения подстроки в название (по GIN
+    индексам gin_trgm_ops), а результаты ранжируются по похожести названия.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @staticmethod
+    def recipe_vector():
+        return SearchVector("name", weight="A", config=SEARCH_CONFIG) + SearchVector(
+            "text", weight="B", config=SEARCH_CONFIG
+        )
+
+    @staticmethod
+    def ingredient_vector():
+        return SearchVector("name", config=SEARCH_CONFIG)
+
+    def search(self, queryset, query, vector, ordering):
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        queryset = queryset.alias(search_vector=vector).annotate(
+            search_rank=SearchRank(F("search_vector"), search_query)
+        )
+        condition = Q(search_vector=search_query)
+        order = [starts_with("name", query), F("search_rank").desc()]
+        if has_trigram_extension(self.alias):
+            condition |= Q(name__icontains=query)
+            queryset = queryset.annotate(
+                search_similarity=TrigramSimilarity("name", query)
+            )
+            order.append(F("search_similarity").desc())
+        return queryset.filter(condition).order_by(*order, ordering)
+
+    def search_recipes(self, queryset, query):
+        return self.search(queryset, query, self.recipe_vector(), "-pk")
+
+    def search_ingredients(self, queryset, query):
+        return self.search(queryset, query, self.ingredient_vector(), "name")
+
+
+def get_search_backend(queryset):
+    """Выбирает реализацию поиска по СУБД, в которой выполняется queryset."""
+    if connections[queryset.db].vendor == "postgresql":
+        return PostgresSearchBackend(queryset.db)
+    return SearchBackend()
@@ -1,16 +1,20 @@
 from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from drf_extra_fields.fields import Base64ImageField  # noqa
-from rest_framework.fields import IntegerField, ReadOnlyField
+from rest_framework.fields import (CharField, DecimalField, IntegerField,
+                                   ReadOnlyField)
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.serializers import (CurrentUserDefault, ModelSerializer,
-                                        SerializerMethodField, ValidationError)
+                                        Serializer, SerializerMethodField,
+                                        ValidationError)
 
 from users.models import User
 from users.serializers import UseridSerializer
 
-from .models import (Amount, Favorite, Follow, Ingredient, Recipe, Tag,
-                     TagRecipe, Trolley)
+from .models import (Amount, Favorite, Follow, Ingredient, Recipe,
+                     ShoppingList, Tag, TagRecipe, Trolley)
 
 
 class TagSerializer(ModelSerializer):
@@ -55,36 +59,36 @@ class UseridSerializer(UseridSerializer):
         model = User
         fields = UseridSerializer.Meta.fields + ("is_subscribed",)
 
+    def get_followed_ids(self, user):
+        """
+        Возвращает множество id авторов, на которых подписан пользователь.
+        Множество вычисляется одним запросом и хранится в контексте, общем
+        для всех вложенных сериализаторов одного ответа.
+        """
+        followed_ids = self.context.get("followed_ids")
+        if followed_ids is None:
+            followed_ids = set(
+                Follow.objects.filter(user=user).values_list("author_id", flat=True)
+            )
+            self.context["followed_ids"] = followed_ids
+        return followed_ids
+
     def get_is_subscribed(self, obj):
         user = self.context["request"].user
         if user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return obj.pk in self.get_followed_ids(user)
 
 
 class FollowEditSerializer(UseridSerializer):
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
-
-    def get_param_value_serialize(self, serializer_field, parameter_name, default=None):
-        return serializer_field.context["request"].query_params.get(
-            parameter_name, default
-        )
+    recipes_count = ReadOnlyField()
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj)
-        if queryset:
-            limit = self.get_param_value_serialize(self, "recipes_limit", "")
-            limit = "".join(char for char in limit if char in "0123456789")
-            if limit:
-                queryset = queryset[: int(limit)]
-        serializer = RecipeFollowers(queryset, many=True)
+        # Рецепты предзагружены SubscribeViewSet с учётом recipes_limit.
+        serializer = RecipeFollowers(obj.recipes.all(), many=True)
         return serializer.data
 
-    @staticmethod
-    def get_recipes_count(obj):
-        return Recipe.objects.filter(author=obj).count()
-
     class Meta(UseridSerializer.Meta):
         fields = UseridSerializer.Meta.fields + ("recipes", "recipes_count")
         model = User
@@ -106,13 +110,59 @@ class AmountSerializer(ModelSerializer):
         return value
 
 
+class ShoppingListSerializer(Serializer):
+    """Строка списка покупок api.units.ShoppingItem."""
+
+    name = CharField(read_only=True)
+    measurement_unit = CharField(read_only=True)
+    amount = DecimalField(max_digits=20, decimal_places=2, read_only=True)
+
+
 class FavoriteSerializer(ModelSerializer):
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
 
 
-class RecipeSerializer(ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Выбор полей ответа параметрами ?fields=id,name и ?omit=text,author для
+    запросов на чтение. Лишние поля удаляются до сериализации, а вьюсет по
+    selected_fields может не загружать данные для них. Поле id остаётся всегда.
+    """
+
+    fields_param = "fields"
+    omit_param = "omit"
+
+    @staticmethod
+    def split_names(value):
+        return {name.strip() for name in value.split(",") if name.strip()}
+
+    @classmethod
+    def selected_fields(cls, request):
+        """Множество выбранных полей или None, если выводятся все поля."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        fields = request.query_params.get(cls.fields_param)
+        omit = request.query_params.get(cls.omit_param)
+        if not fields and not omit:
+            return None
+        selected = set(cls.Meta.fields)
+        if fields:
+            selected &= cls.split_names(fields)
+        if omit:
+            selected -= cls.split_names(omit)
+        return selected | {"id"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.selected_fields(self.context.get("request"))
+        if selected is not None:
+            for name in set(self.fields) - selected:
+                self.fields.pop(name)
+
+
+class RecipeSerializer(SparseFieldsetMixin, ModelSerializer):
     tags = TagSerializer(many=True, required=True)
     ingredients = AmountSerializer(many=True, required=True)
     author = UseridSerializer(default=CurrentUserDefault())
@@ -137,17 +187,24 @@ class RecipeSerializer(ModelSerializer):
         )
         read_only_fields = ("id", "is_favorited", "is_in_shopping_cart")
 
-    def get_is_favorited(self, obj):
+    def get_user_flag(self, obj, name, model):
+        """
+        Возвращает признак рецепта для текущего пользователя. Рецепты из
+        RecipeQuerySet.with_user_flags уже содержат признак, запрос к БД
+        выполняется только для рецептов без аннотации (после создания).
+        """
+        if hasattr(obj, name):
+            return getattr(obj, name)
         user = self.context["request"].user
         if user.is_anonymous:
             return False
-        return Favorite.objects.filter(user=user, recipe=obj).exists()
+        return model.objects.filter(user=user, recipe=obj).exists()
+
+    def get_is_favorited(self, obj):
+        return self.get_user_flag(obj, "is_favorited", Favorite)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context["request"].user
-        if user.is_anonymous:
-            return False
-        return Trolley.objects.filter(user=user, recipe=obj).exists()
+        return self.get_user_flag(obj, "is_in_shopping_cart", Trolley)
 
     @staticmethod
     def validate_cooking_time(value):
@@ -162,18 +219,39 @@ class RecipeSerializer(ModelSerializer):
         TagRecipe.objects.bulk_create(tagrecipe)
 
     def ingredient_amount(self, recipe, ingredients):
-        old_ings = recipe.ingredients.all()
-        new_ings = [None] * len(ingredients)
-        for pos, obj in enumerate(ingredients):
-            amount = obj["amount"]
-            ing = get_object_or_404(Ingredient, pk=obj["ingredient"]["pk"])
-            obj, create = old_ings.get_or_create(
-                recipe=recipe, amount=amount, ingredient=ing
-            )
-            new_ings[pos] = obj
-        for ing in old_ings:
-            if ing not in new_ings:
-                ing.delete()
+        """
+        Приводит ингредиенты рецепта к списку ingredients за постоянное число
+        запросов: новые строки создаются bulk_create, изменённые количества
+        сохраняются bulk_update, лишние строки удаляются одним delete().
+        Возвращает словари {id ингредиента: количество} до и после изменения.
+        """
+        new_totals = {}
+        for obj in ingredients:
+            pk = obj["ingredient"]["pk"]
+            new_totals[pk] = new_totals.get(pk, 0) + obj["amount"]
+        if len(Ingredient.objects.in_bulk(new_totals)) != len(new_totals):
+            raise Http404("Ингредиент не найден.")
+        old_totals, old_amounts, del_list = {}, {}, []
+        for amount in recipe.ingredients.all():
+            pk = amount.ingredient_id
+            old_totals[pk] = old_totals.get(pk, 0) + amount.amount
+            if pk in new_totals and pk not in old_amounts:
+                old_amounts[pk] = amount
+            else:
+                del_list.append(amount.pk)
+        add_list, update_list = [], []
+        for pk, total in new_totals.items():
+            amount = old_amounts.get(pk)
+            if amount is None:
+                add_list.append(Amount(recipe=recipe, ingredient_id=pk, amount=total))
+            elif amount.amount != total:
+                amount.amount = total
+                update_list.append(amount)
+        if del_list:
+            Amount.objects.filter(pk__in=del_list).delete()
+        Amount.objects.bulk_update(update_list, ("amount",))
+        Amount.objects.bulk_create(add_list)
+        return old_totals, new_totals
 
     def del_create_separate(self, old_list, new_list):
         """
@@ -181,8 +259,9 @@ class RecipeSerializer(ModelSerializer):
         предыдущего списка, add_list - элементы которые надо бобавить в новый.
         После этого список old_list станет соответствовать new_list.
         """
-        del_list = tuple(obj for obj in old_list if obj not in new_list)
-        add_list = tuple(obj for obj in new_list if obj not in old_list)
+        old_set, new_set = set(old_list), set(new_list)
+        del_list = tuple(obj for obj in old_list if obj not in new_set)
+        add_list = tuple(obj for obj in new_list if obj not in old_set)
         return add_list, del_list
 
     @transaction.atomic
@@ -205,15 +284,15 @@ class RecipeSerializer(ModelSerializer):
         # Выдёргиваю поля напрямую не относящиеся к рецепту.
         # Обновляю тэги
         tags = validated_data.pop("tags")
-        old_tags = TagRecipe.objects.filter(recipe=instance).values_list(
-            "tag", flat=True
-        )
+        old_tags = [tag_recipe.tag for tag_recipe in instance.tags.all()]
         add_tags, del_tags = self.del_create_separate(old_tags, tags)
-        TagRecipe.objects.filter(tag__in=del_tags, recipe=instance).delete()
+        if del_tags:
+            TagRecipe.objects.filter(tag__in=del_tags, recipe=instance).delete()
         self.tag_recipe_create(instance, add_tags)
-        # Обновляю ингредиениты.
+        # Обновляю ингредиениты и списки покупок с этим рецептом.
         ingredients = validated_data.pop("ingredients")
-        self.ingredient_amount(instance, ingredients)
+        old_totals, new_totals = self.ingredient_amount(instance, ingredients)
+        ShoppingList.objects.change_recipe(instance, old_totals, new_totals)
         # даляю старое изображение если будет записано новое.
         if "image" in validated_data:
             instance.image.delete()
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+
+from .caching import bump_version
+from .ingredient_index import ingredient_index
+from .models import (Amount, Ingredient, Recipe, ShoppingList, Tag,
+                     change_counter)
+from .pantry_index import pantry_index
+from .similarity import similarity_index
+
+AUTHOR_FIELDS = {"email", "username", "first_name", "last_name"}
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient(sender, instance, **kwargs):
+    """Добавляет сохранённый ингредиент в индекс после фиксации транзакции."""
+    transaction.on_commit(lambda: ingredient_index.update(instance.pk, instance))
+
+
+@receiver(post_delete, sender=Ingredient)
+def unindex_ingredient(sender, instance, **kwargs):
+    """Удаляет ингредиент из индекса после фиксации транзакции."""
+    pk = instance.pk
+    transaction.on_commit(lambda: ingredient_index.update(pk, None))
+
+
+@receiver(pre_delete, sender=Recipe)
+def unlink_deleted_recipe(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты удаляемого рецепта из списков покупок и уменьшает
+    счётчик рецептов автора. Сигнал отправляется и при удалении рецептов
+    через QuerySet (в том числе в админке), и при каскадном удалении вместе
+    с автором, пока строки корзин и ингредиентов ещё не удалены.
+    """
+    ShoppingList.objects.change_recipe(instance, Amount.objects.totals(instance), {})
+    change_counter(User.objects.filter(pk=instance.author_id), "recipes_count", -1)
+
+
+def refresh_recipe_indexes(*pks):
+    """
+    Обновляет рецепты pks в индексах в памяти одним обработчиком после
+    фиксации транзакции.
+    """
+
+    def refresh():
+        for pk in pks:
+            pantry_index.refresh(pk)
+            if similarity_index.is_available():
+                similarity_index.refresh(pk)
+
+    transaction.on_commit(refresh)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    """
+    Обновляет рецепт в индексах после фиксации транзакции. Рецепт
+    сохраняется при каждом изменении через API, а ингредиенты пишутся
+    bulk_create, bulk_update и delete() без сигналов, поэтому обновление
+    привязано к сохранению самого рецепта. Приёмников сигналов Amount и
+    TagRecipe нет намеренно: они отключили бы быстрое удаление их строк.
+    """
+    refresh_recipe_indexes(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_reference_cache(sender, **kwargs):
+    """
+    Сбрасывает кэш списка справочника сразу и ещё раз после фиксации
+    транзакции: иначе параллельный запрос мог бы закэшировать под новой
+    версией данные, прочитанные до фиксации.
+    """
+    name = "tags" if sender is Tag else "ingredients"
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    """Отмечает изменёнными рецепты с изменённым или удаляемым тэгом."""
+    if created:
+        return
+    Recipe.objects.filter(tags__tag=instance).touch()
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    """Отмечает изменёнными рецепты с изменённым или удаляемым ингредиентом."""
+    if created:
+        return
+    Recipe.objects.filter(ingredients__ingredient=instance).touch()
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    """
+    Отмечает изменёнными рецепты автора при изменении данных, выводимых в
+    рецепте. Сохранения только last_login или пароля рецепты не меняют.
+    """
+    if created:
+        return
+    if update_fields and not set(update_fields) & AUTHOR_FIELDS:
+        return
+    Recipe.objects.filter(author=instance).touch()
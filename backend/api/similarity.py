@@ -0,0 +1,282 @@
+import os
+
+from django.conf import settings
+
+from .memory_index import MemoryIndex
+from .models import Amount, TagRecipe
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover
+    np = sparse = None
+
+# Виды признаков рецепта: столбцы матрицы - ингредиенты и тэги.
+INGREDIENT, TAG = 0, 1
+
+
+class SimilarityIndex(MemoryIndex):
+    """
+    Похожие рецепты по косинусной близости разреженных векторов признаков:
+    ингредиенты рецепта с весом 1 и тэги с весом SIMILAR_TAG_WEIGHT. Векторы
+    хранятся строками нормированной матрицы scipy.sparse CSR, поэтому
+    близость рецепта ко всем остальным - одно умножение матрицы на вектор,
+    а лучшие k выбираются np.partition без циклов Python.
+
+    Матрицу строит команда build_similarity и сохраняет в файл
+    SIMILAR_MATRIX_PATH; процесс загружает его при построении индекса и
+    после перестройки файла. Без нового файла матрица перестраивается из БД
+    не реже, чем раз в SIMILAR_INDEX_TTL секунд, см. MemoryIndex. Векторы
+    рецептов, изменённых сигналами сохранения, до перестройки хранятся в
+    небольшом словаре overlay {id рецепта: (столбцы, веса)} поверх матрицы:
+    копировать матрицу ради одной строки дорого.
+    """
+
+    ttl_setting = "SIMILAR_INDEX_TTL"
+
+    def is_available(self):
+        return sparse is not None
+
+    def empty(self):
+        return {
+            "matrix": None,
+            "recipe_ids": None,
+            "rows": {},
+            "columns": {},
+            "overlay": {},
+            "overlay_cache": None,
+            "loaded_mtime": None,
+            "file_mtime": None,
+        }
+
+    @staticmethod
+    def pairs(model, field):
+        rows = (
+            model.objects.order_by()
+            .values_list("recipe", field)
+            .distinct()
+            .iterator()
+        )
+        return np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+
+    @staticmethod
+    def normalize(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+    def build_matrix(self):
+        """Строит матрицу из БД: два запроса и векторные операции numpy."""
+        amounts = self.pairs(Amount, "ingredient")
+        tags = self.pairs(TagRecipe, "tag")
+        recipe_ids = np.union1d(amounts[:, 0], tags[:, 0])
+        ingredient_ids = np.unique(amounts[:, 1])
+        tag_ids = np.unique(tags[:, 1])
+        rows = np.concatenate(
+            (
+                np.searchsorted(recipe_ids, amounts[:, 0]),
+                np.searchsorted(recipe_ids, tags[:, 0]),
+            )
+        )
+        columns = np.concatenate(
+            (
+                np.searchsorted(ingredient_ids, amounts[:, 1]),
+                len(ingredient_ids) + np.searchsorted(tag_ids, tags[:, 1]),
+            )
+        )
+        data = np.concatenate(
+            (
+                np.ones(len(amounts)),
+                np.full(len(tags), float(settings.SIMILAR_TAG_WEIGHT)),
+            )
+        )
+        matrix = sparse.csr_matrix(
+            (data, (rows, columns)),
+            shape=(len(recipe_ids), len(ingredient_ids) + len(tag_ids)),
+        )
+        kinds = np.concatenate(
+            (np.full(len(ingredient_ids), INGREDIENT), np.full(len(tag_ids), TAG))
+        )
+        return (
+            self.normalize(matrix),
+            recipe_ids,
+            kinds,
+            np.concatenate((ingredient_ids, tag_ids)),
+        )
+
+    @staticmethod
+    def arrays(matrix, recipe_ids, kinds, keys):
+        """Данные индекса из матрицы и массивов id строк и столбцов."""
+        return {
+            "matrix": matrix,
+            "recipe_ids": recipe_ids,
+            "rows": {int(pk): row for row, pk in enumerate(recipe_ids) if pk},
+            "columns": {
+                (int(kind), int(key)): column
+                for column, (kind, key) in enumerate(zip(kinds, keys))
+            },
+            "overlay": {},
+            "overlay_cache": None,
+        }
+
+    def save(self, path):
+        """Строит матрицу из БД и сохраняет её в файл path (.npz)."""
+        matrix, recipe_ids, kinds, keys = self.build_matrix()
+        temporary = f"{path}.tmp.npz"
+        np.savez_compressed(
+            temporary,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            recipe_ids=recipe_ids,
+            kinds=kinds,
+            keys=keys,
+        )
+        # Процессы не должны прочитать недописанный файл.
+        os.replace(temporary, path)
+        return matrix
+
+    @classmethod
+    def read_file(cls, path):
+        with np.load(path) as saved:
+            matrix = sparse.csr_matrix(
+                (saved["data"], saved["indices"], saved["indptr"]),
+                shape=tuple(saved["shape"]),
+            )
+            return cls.arrays(
+                matrix, saved["recipe_ids"], saved["kinds"], saved["keys"]
+            )
+
+    def load(self):
+        """
+        Матрица из файла SIMILAR_MATRIX_PATH, если он изменился с прошлой
+        загрузки, иначе из БД.
+        """
+        path = settings.SIMILAR_MATRIX_PATH
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime is not None and mtime != self.loaded_mtime:
+            return dict(self.read_file(path), loaded_mtime=mtime, file_mtime=mtime)
+        return dict(
+            self.arrays(*self.build_matrix()),
+            loaded_mtime=self.loaded_mtime,
+            file_mtime=None,
+        )
+
+    def loaded_as_of(self, started):
+        # Матрица из файла отражает БД на время его записи.
+        return self.file_mtime or started
+
+    def read(self, pk):
+        return self.features(pk)
+
+    def features(self, pk):
+        """Пары (вид, id) признаков рецепта pk с их весами."""
+        weight = float(settings.SIMILAR_TAG_WEIGHT)
+        ingredients = Amount.objects.filter(recipe=pk).values_list(
+            "ingredient", flat=True
+        )
+        tags = TagRecipe.objects.filter(recipe=pk).values_list("tag", flat=True)
+        features = {(INGREDIENT, ingredient): 1.0 for ingredient in ingredients}
+        features.update({(TAG, tag): weight for tag in tags})
+        return features
+
+    def apply(self, pk, features):
+        """
+        Записывает в overlay нормированный вектор признаков features рецепта
+        pk; у удалённого рецепта вектор пуст.
+        """
+        for feature in features:
+            self.columns.setdefault(feature, len(self.columns))
+        columns = np.array(
+            sorted(self.columns[feature] for feature in features), dtype=np.int64
+        )
+        weights = {
+            self.columns[feature]: weight for feature, weight in features.items()
+        }
+        data = np.array([weights[column] for column in columns], dtype=float)
+        if len(data):
+            data /= np.sqrt((data ** 2).sum())
+        self.overlay[pk] = (columns, data)
+        self.overlay_cache = None
+
+    def vector(self, pk):
+        """Столбцы и веса нормированного вектора рецепта pk или None."""
+        if pk in self.overlay:
+            return self.overlay[pk]
+        row = self.rows.get(pk)
+        if row is None:
+            return None
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def overlay_arrays(self):
+        """
+        Матрица CSR векторов overlay, id их рецептов и строки этих рецептов
+        в основной матрице. Строится при первом запросе после изменения
+        overlay.
+        """
+        if self.overlay_cache is None:
+            vectors = list(self.overlay.values())
+            matrix = sparse.csr_matrix(
+                (
+                    np.concatenate([np.empty(0)] + [data for _, data in vectors]),
+                    np.concatenate(
+                        [np.empty(0, dtype=np.int64)]
+                        + [columns for columns, _ in vectors]
+                    ),
+                    np.cumsum([0] + [len(columns) for columns, _ in vectors]),
+                ),
+                shape=(len(vectors), len(self.columns)),
+            )
+            rows = [self.rows[pk] for pk in self.overlay if pk in self.rows]
+            self.overlay_cache = (
+                matrix,
+                np.array(list(self.overlay), dtype=np.int64),
+                np.array(rows, dtype=np.int64),
+            )
+        return self.overlay_cache
+
+    def scores(self, columns, data):
+        """
+        Близость вектора ко всем рецептам: массивы id рецептов и близостей.
+        Строки матрицы рецептов из overlay не учитываются, вместо них
+        считается близость к их новым векторам тем же умножением матриц.
+        """
+        overlay, changed, masked = self.overlay_arrays()
+        vector = sparse.csr_matrix(
+            (data, columns, [0, len(columns)]), shape=(1, len(self.columns))
+        )
+        scores = (self.matrix @ vector[:, : self.matrix.shape[1]].T).toarray().ravel()
+        scores[masked] = 0
+        return (
+            np.concatenate((self.recipe_ids, changed)),
+            np.concatenate((scores, (overlay @ vector.T).toarray().ravel())),
+        )
+
+    def similar(self, pk, limit=None):
+        """
+        Не более limit рецептов, похожих на рецепт pk, по убыванию близости:
+        список пар (id рецепта, косинусная близость), близость больше нуля.
+        """
+        if limit is None:
+            limit = settings.SIMILAR_RESULTS_LIMIT
+        self.ensure_built()
+        with self.lock:
+            vector = self.vector(pk)
+            if vector is None or not len(vector[0]):
+                return []
+            recipe_ids, scores = self.scores(*vector)
+        scores[recipe_ids == pk] = 0
+        limit = min(limit, np.count_nonzero(scores > 0))
+        if not limit:
+            return []
+        # Рецепты с той же близостью, что и последний из лучших, тоже
+        # кандидаты: среди равных выбираются более новые.
+        threshold = -np.partition(-scores, limit - 1)[limit - 1]
+        best = np.flatnonzero(scores >= threshold)
+        best = best[np.lexsort((-recipe_ids[best], -scores[best]))][:limit]
+        return [(int(recipe_ids[row]), float(scores[row])) for row in best]
+
+
+similarity_index = SimilarityIndex()
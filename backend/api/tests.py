@@ -1,20 +1,51 @@
+import csv
 import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from math import sqrt
 from random import choice, choices, randint
+from shutil import rmtree
+from tempfile import TemporaryDirectory, mkdtemp
 from time import time
+from unittest import skipUnless
 
+from django.conf import settings
+from django.contrib import admin
 from django.core.cache import cache
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.translation import gettext_lazy
 
-from rest_framework.test import APIClient
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
 from users.models import User
 
-from .models import (Amount, Favorite, Follow, Ingredient, Recipe, Tag,
-                     TagRecipe, Trolley)
-
-
+from .filters import RecipeFilter, RecipeSearchFilter
+from .ingredient_index import ingredient_index
+from .management.commands.recount import COUNTERS
+from .models import (Amount, Favorite, Follow, Ingredient, Recipe, RecipeScore,
+                     ShoppingList, Tag, TagRecipe, TimelineEntry, Trolley)
+from .pantry_index import pantry_index
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .similarity import similarity_index
+from .units import humanize_rows
+
+
+# Картинки рецептов, созданных в тестах, пишутся во временный каталог, а
+# не в media проекта.
+@override_settings(MEDIA_ROOT=mkdtemp())
 class BaseTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -45,6 +76,11 @@ class BaseTestCase(TestCase):
         cls.token = data.get("auth_token")
         cls.user = User.objects.get(username=username)
 
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         cls = self.__class__
         self.authorized = APIClient()
@@ -52,6 +88,18 @@ class BaseTestCase(TestCase):
         self.anonime = APIClient()
         cache.clear()
 
+    @staticmethod
+    def create_recipe(author, name, ingredients=(), tags=()):
+        """Рецепт author с ингредиентами ingredients и тэгами tags."""
+        recipe = Recipe.objects.create(
+            image="test.img", author=author, name=name, text=name, cooking_time=1
+        )
+        for ingredient in ingredients:
+            Amount.objects.create(recipe=recipe, ingredient=ingredient)
+        for tag in tags:
+            TagRecipe.objects.create(recipe=recipe, tag=tag)
+        return recipe
+
     def in_or_equ(self, data, name, value=None):
 
         if value:
@@ -70,6 +118,20 @@ class BaseTestCase(TestCase):
         self.assertIsInstance(results, list)
         return results
 
+    def get_queries(self, client, url, data=None, table=None):
+        """
+        Выполняет GET запрос и возвращает список SQL запросов к БД, при
+        указании table - только запросы затрагивающие эту таблицу.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, data=data)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if table is None or f'"{table}"' in query["sql"]
+        ]
+
     def is_instance(self, obj, model):
         """Проверяет что объект модели находится в БД"""
         self.assertTrue(model.objects.filter(**obj).exists())
@@ -225,6 +287,12 @@ class EndpointsTestCase(TestCase):
             ),
             ("recipe-shopping-cart", "api/recipes/1/shopping_cart", {"id": 1}),
             ("recipe-favorite", "api/recipes/1/favorite", {"id": 1}),
+            ("recipe-similar", "api/recipes/1/similar", {"id": 1}),
+            ("recipe-batch", "api/recipes/batch", None),
+            ("recipe-feed", "api/recipes/feed", None),
+            ("recipe-pantry", "api/recipes/pantry", None),
+            ("recipe-shopping-cart-bulk", "api/recipes/shopping_cart/bulk", None),
+            ("recipe-favorite-bulk", "api/recipes/favorite/bulk", None),
             # ingredients endpoints
             ("ingredient-list", "api/ingredients", None),
             ("ingredient-detail", "api/ingredients/1", {"id": 1}),
@@ -236,6 +304,48 @@ class EndpointsTestCase(TestCase):
                 self.assertEqual(url_reversed, url)
 
 
+class JSONRenderersTestCase(TestCase):
+    def test_fast_renderer_matches_json_renderer(self):
+        """
+        Проверяет, что FastJSONRenderer выводит то же, что и JSONRenderer,
+        в том числе для Decimal, ленивых строк, дат и U+2028.
+        """
+        data = {
+            "amount": Decimal("12.50"),
+            "unit": gettext_lazy("г"),
+            "date": datetime(2022, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            "text": "Строка\u2028с разделителем",
+            "items": (1, 2.5, None, True),
+            1: "ключ-число",
+        }
+        for media_type in ("application/json", "application/json; indent=4"):
+            with self.subTest(media_type=media_type):
+                self.assertEqual(
+                    FastJSONRenderer().render(data, media_type),
+                    JSONRenderer().render(data, media_type),
+                )
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_fast_parser(self):
+        """Проверяет разбор JSON и ошибку разбора в FastJSONParser."""
+        content = '{"name": "Борщ", "amount": 1.5}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO(content)), {"name": "Борщ", "amount": 1.5}
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"amount": NaN}'))
+
+    def test_benchmark_renderers_command(self):
+        """Проверяет вывод команды сравнения рендереров."""
+        out = StringIO()
+        call_command(
+            "benchmark_renderers", recipes=5, number=1, repeat=1, stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn("FastJSONRenderer:", output)
+        self.assertIn("Ускорение:", output)
+
+
 class TagsTestCase(BaseTestCase):
     @classmethod
     def setUpClass(cls):
@@ -266,6 +376,28 @@ class TagsTestCase(BaseTestCase):
         self.is_tag(data)
         self.assertEqual(data.get("id", None), 2)
 
+    def test_tags_list_cache(self):
+        """
+        Проверяет, что повторный запрос списка тегов не обращается к БД,
+        ответ с ETag даёт 304, а изменение тегов сбрасывает кэш.
+        """
+        url = reverse("tag-list")
+        response = self.anonime.get(url)
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.anonime.get(url)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(response["ETag"], etag)
+        self.is_tags(json.loads(response.content), len(self.tags))
+        response = self.anonime.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        Tag.objects.create(id=4, name="Полдник", color="#FFFF00", slug="poldnik")
+        response = self.anonime.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.is_tags(json.loads(response.content), len(self.tags) + 1)
+
     def test_tags_wrong_id(self):
         """Проверяет получение не верного тега по id без авторизации"""
         url = reverse("tag-detail", kwargs={"id": 200})
@@ -294,6 +426,11 @@ class IngredientsTestCase(BaseTestCase):
         for ingredient in cls.ingredients:
             Ingredient.objects.create(**ingredient)
 
+    def setUp(self):
+        super().setUp()
+        # Индекс живёт в памяти процесса и не откатывается вместе с БД.
+        ingredient_index.clear()
+
     def test_ingredients_list(self):
         """Проверяет получение списка ингредиентов без авторизации"""
         url = reverse("ingredient-list")
@@ -327,6 +464,76 @@ class IngredientsTestCase(BaseTestCase):
         self.assertIsInstance(data, list)
         self.assertEqual(len(data), 3)
 
+    def test_ingredient_search_ranking(self):
+        """
+        Проверяет, что совпадения по началу имени идут перед совпадениями
+        по подстроке, а поиск не обращается к БД.
+        """
+        url = reverse("ingredient-list")
+        self.anonime.get(url, data={"name": "ка"})
+        with CaptureQueriesContext(connection) as context:
+            response = self.anonime.get(url, data={"name": "КА"})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(context.captured_queries), 0)
+        names = [item["name"] for item in json.loads(response.content)]
+        self.assertEqual(
+            names,
+            ["Кактус", "Капуста", "Карп", "Картон", "Качан", "Тусовка опят"],
+        )
+        for item in json.loads(response.content):
+            self.is_ingredient(item)
+        response = self.anonime.get(url, data={"name": "тусо"})
+        names = [item["name"] for item in json.loads(response.content)]
+        self.assertEqual(names, ["Тусовка опят"])
+        response = self.anonime.get(url, data={"name": "ябрикос"})
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_ingredients_list_cache(self):
+        """Проверяет сброс кэша списка ингредиентов при удалении."""
+        url = reverse("ingredient-list")
+        self.anonime.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.anonime.get(url)
+        self.assertEqual(len(context.captured_queries), 0)
+        Ingredient.objects.filter(id=9).get().delete()
+        response = self.anonime.get(url)
+        self.is_ingredients(json.loads(response.content), len(self.ingredients) - 1)
+
+    def test_ingredient_ranked_search(self):
+        """Проверяет ранжированный поиск ингредиентов по ?search=."""
+        url = reverse("ingredient-list")
+        response = self.anonime.get(url, data={"search": "Капуста"})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = json.loads(response.content)
+        self.assertEqual([item["name"] for item in data], ["Капуста"])
+        self.is_ingredient(data[0])
+
+    def test_ingredient_search_limit(self):
+        """Проверяет ограничение числа результатов поиска."""
+        url = reverse("ingredient-list")
+        with self.settings(INGREDIENT_SEARCH_LIMIT=2):
+            response = self.anonime.get(url, data={"name": "а"})
+        names = [item["name"] for item in json.loads(response.content)]
+        self.assertEqual(names, ["Абрикос", "Кактус"])
+
+    def test_ingredient_index_signals(self):
+        """Проверяет обновление индекса при сохранении и удалении."""
+        url = reverse("ingredient-list")
+        self.anonime.get(url, data={"name": "ли"})
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                id=10, name="Лиса", measurement_unit="шт"
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(id=9).get().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient = Ingredient.objects.get(id=7)
+            ingredient.name = "Лист лавровый"
+            ingredient.save()
+        response = self.anonime.get(url, data={"name": "ли"})
+        names = [item["name"] for item in json.loads(response.content)]
+        self.assertEqual(names, ["Лиса", "Лист лавровый"])
+
 
 class UsersTestCase(BaseTestCase):
     @classmethod
@@ -490,6 +697,77 @@ class UsersTestCase(BaseTestCase):
             with self.subTest(result=result):
                 self.data_user_subscribe(result)
 
+    def test_users_subscriptions_queries_count(self):
+        """
+        Проверяет что список подписок формируется фиксированным числом
+        запросов к БД независимо от размера страницы и recipes_limit.
+        """
+        cls = self.__class__
+        for number in range(5):
+            author = User.objects.create(
+                username=f"author_{number}",
+                email=f"author_{number}@mail.ru",
+                password="password_cvnmxbzvjhgsd",
+            )
+            Follow.objects.create(user=cls.user, author=author)
+            for recipe in range(number):
+                Recipe.objects.create(
+                    image=None,
+                    author=author,
+                    name=f"Рецепт {number}.{recipe}",
+                    text=f"Рецепт {number}.{recipe}",
+                    cooking_time=1,
+                )
+        url = reverse("user-subscriptions")
+        counts = set()
+        for limit in (2, 7):
+            for recipes_limit in ("", "1", "3"):
+                data = {"limit": limit, "recipes_limit": recipes_limit}
+                with self.subTest(data=data):
+                    counts.add(len(self.get_queries(self.authorized, url, data)))
+        self.assertEqual(len(counts), 1)
+
+    def test_users_subscriptions_recipes_limit(self):
+        """Проверяет ограничение числа рецептов авторов в списке подписок."""
+        url = reverse("user-subscriptions")
+        for recipes_limit in (0, 2, 100):
+            response = self.authorized.get(
+                url, data={"limit": 100, "recipes_limit": recipes_limit}
+            )
+            data = json.loads(response.content)
+            for result in data.get("results"):
+                with self.subTest(recipes_limit=recipes_limit, result=result):
+                    author = User.objects.get(pk=result.get("id"))
+                    count = author.recipes.count()
+                    self.assertEqual(result.get("recipes_count"), count)
+                    latest = author.recipes.order_by("-pk")[:recipes_limit]
+                    self.assertEqual(
+                        [recipe.get("id") for recipe in result.get("recipes")],
+                        [recipe.pk for recipe in latest],
+                    )
+
+    def test_users_subscriptions_list_with_cursor(self):
+        """Проверяет обход списка подписок по курсору."""
+        url = reverse("user-subscriptions")
+        response = self.authorized.get(url, data={"cursor": "", "limit": 1})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = json.loads(response.content)
+        self.assertNotIn("count", data)
+        ids = []
+        while True:
+            ids.extend(author.get("id") for author in data.get("results"))
+            if data.get("next") is None:
+                break
+            data = json.loads(self.authorized.get(data.get("next")).content)
+        self.assertEqual(
+            ids,
+            list(
+                User.objects.filter(following__user=self.__class__.user)
+                .order_by("-pk")
+                .values_list("pk", flat=True)
+            ),
+        )
+
     def test_users_subscribe_unsubscribe(self):
         """Проверяет возможность пользователя подписаться и отписаться."""
         count = Follow.objects.filter(user=self.__class__.user).count()
@@ -670,6 +948,26 @@ class RecipeTestCase(BaseTestCase):
             Favorite.objects.create(recipe=recipe, user=cls.user0)
             Trolley.objects.create(recipe=recipe, user=cls.user0)
 
+        # Корзины заполнены напрямую, списки покупок собираются заново.
+        ShoppingList.objects.rebuild()
+
+    def is_shopping_list_actual(self, user):
+        """
+        Проверяет что список покупок совпадает с пересчитанным с нуля по
+        корзине.
+        """
+
+        def rows():
+            return set(
+                ShoppingList.objects.filter(user=user).values_list(
+                    "ingredient", "amount"
+                )
+            )
+
+        actual = rows()
+        ShoppingList.objects.rebuild(users=[user])
+        self.assertEqual(actual, rows())
+
     def test_receipes_list(self):
         """Проверяет получение списка рецептов."""
         url = reverse("recipe-list")
@@ -731,6 +1029,520 @@ class RecipeTestCase(BaseTestCase):
                         record.get("is_in_shopping_cart"), is_in_shopping_cart
                     )
 
+    def test_recipes_list_user_flags_queries(self):
+        """
+        Проверяет что признаки is_favorited и is_in_shopping_cart не добавляют
+        запросов к БД при увеличении размера страницы.
+        """
+        url = reverse("recipe-list")
+        for client in (self.authorized, self.anonime):
+            for table in ("api_favorite", "api_trolley"):
+                with self.subTest(client=client, table=table):
+                    small = self.get_queries(client, url, {"limit": 2}, table)
+                    large = self.get_queries(client, url, {"limit": 10}, table)
+                    self.assertEqual(len(small), len(large))
+
+    def test_recipes_list_author_queries(self):
+        """
+        Проверяет что данные автора рецепта и признак подписки на него не
+        добавляют запросов к БД при увеличении размера страницы.
+        """
+        url = reverse("recipe-list")
+        for client in (self.authorized, self.anonime):
+            for table in ("users_user", "api_follow"):
+                with self.subTest(client=client, table=table):
+                    small = self.get_queries(client, url, {"limit": 2}, table)
+                    large = self.get_queries(client, url, {"limit": 10}, table)
+                    self.assertEqual(len(small), len(large))
+
+    def test_recipes_author_is_subscribed(self):
+        """Проверяет признак подписки на автора в списке рецептов."""
+        cls = self.__class__
+        Follow.objects.create(user=cls.user, author=cls.user0)
+        Recipe.objects.create(
+            image=None,
+            author=cls.user0,
+            name="Рецепт автора с подпиской",
+            text="Рецепт автора с подпиской",
+            cooking_time=1,
+        )
+        response = self.authorized.get(reverse("recipe-list"), {"limit": 100})
+        data = json.loads(response.content)
+        for recipe in self.page_paginated(data):
+            author = recipe.get("author")
+            with self.subTest(author=author):
+                self.assertEqual(
+                    author.get("is_subscribed"), author.get("id") == cls.user0.pk
+                )
+
+    def test_recipes_list_queries_count(self):
+        """
+        Проверяет что страница рецептов с тэгами и ингредиентами формируется
+        фиксированным числом запросов к БД независимо от размера страницы.
+        """
+        url = reverse("recipe-list")
+        # count, рецепты, тэги, ингредиенты; для авторизованного пользователя
+        # добавляются проверка токена и подписки на авторов.
+        for client, count in ((self.anonime, 4), (self.authorized, 6)):
+            for limit in (2, 10, 100):
+                with self.subTest(client=client, limit=limit):
+                    # Без кэша общих данных рецептов.
+                    cache.clear()
+                    queries = self.get_queries(client, url, {"limit": limit})
+                    self.assertEqual(len(queries), count)
+
+    def test_recipes_sparse_fieldsets(self):
+        """
+        Проверяет выбор полей рецептов параметрами fields и omit: лишние
+        поля не выводятся, а тэги, ингредиенты и подписки не загружаются.
+        """
+        url = reverse("recipe-list")
+        card = {"id", "name", "image", "cooking_time"}
+        data = {"fields": "name,image,cooking_time", "limit": 100}
+        for client, count in ((self.anonime, 2), (self.authorized, 3)):
+            with self.subTest(client=client):
+                queries = self.get_queries(client, url, data)
+                # count и рецепты страницы, для авторизованного - токен.
+                self.assertEqual(len(queries), count)
+                self.assertNotIn('"text"', queries[-1])
+                self.assertNotIn('"users_user"', queries[-1])
+                results = json.loads(client.get(url, data=data).content)["results"]
+                self.assertEqual(len(results), Recipe.objects.count())
+                for recipe in results:
+                    self.assertEqual(set(recipe), card)
+        data = {"omit": "text,ingredients,unknown", "limit": 100}
+        queries = self.get_queries(self.authorized, url, data)
+        # Токен, count, рецепты, тэги и подписки, без ингредиентов.
+        self.assertEqual(len(queries), 5)
+        self.assertFalse([query for query in queries if '"api_amount"' in query])
+        recipe = json.loads(self.authorized.get(url, data=data).content)["results"][0]
+        self.assertEqual(
+            set(recipe),
+            {
+                "id",
+                "tags",
+                "author",
+                "is_favorited",
+                "is_in_shopping_cart",
+                "name",
+                "image",
+                "cooking_time",
+            },
+        )
+        self.assertIn("is_subscribed", recipe["author"])
+        detail = reverse("recipe-detail", kwargs={"id": recipe["id"]})
+        response = self.anonime.get(detail, data={"fields": "name"})
+        self.assertEqual(set(json.loads(response.content)), {"id", "name"})
+        etag = response["ETag"]
+        response = self.anonime.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.is_recipe(json.loads(response.content))
+
+    def test_recipes_batch(self):
+        """
+        Проверяет получение рецептов списком id: порядок запроса, отчёт о
+        ненайденных id и постоянное число запросов к БД.
+        """
+        url = reverse("recipe-batch")
+        pks = list(Recipe.objects.order_by("?").values_list("pk", flat=True))
+        missing = max(pks) + 1
+        ids = [pks[2], missing, pks[0], pks[2], pks[1]]
+        response = self.authorized.get(url, data={"ids": ",".join(map(str, ids))})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = json.loads(response.content)
+        self.assertEqual(
+            [recipe["id"] for recipe in data["results"]], [pks[2], pks[0], pks[1]]
+        )
+        self.assertEqual(data["missing"], [missing])
+        for recipe in data["results"]:
+            self.is_recipe(recipe)
+        # Рецепты, тэги, ингредиенты.
+        for size in (3, len(pks)):
+            with self.subTest(size=size):
+                cache.clear()
+                data = {"ids": ",".join(map(str, pks[:size]))}
+                self.assertEqual(len(self.get_queries(self.anonime, url, data)), 3)
+        response = self.anonime.get(
+            url, data={"ids": pks[:2], "fields": "name"}
+        )
+        results = json.loads(response.content)["results"]
+        self.assertEqual([set(recipe) for recipe in results], [{"id", "name"}] * 2)
+
+    def test_recipes_batch_wrong_ids(self):
+        """Проверяет ошибки при неверном или слишком длинном списке id."""
+        url = reverse("recipe-batch")
+        for ids in ("", "1,a", "-1"):
+            with self.subTest(ids=ids):
+                response = self.anonime.get(url, data={"ids": ids})
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                self.assertIn("errors", json.loads(response.content))
+        with self.settings(RECIPE_BATCH_LIMIT=2):
+            response = self.anonime.get(url, data={"ids": "1,2,3"})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_recipes_list_fragment_cache(self):
+        """
+        Проверяет, что закэшированные рецепты не загружают тэги и
+        ингредиенты повторно, а признаки пользователя берутся из запроса.
+        """
+        cls = self.__class__
+        url = reverse("recipe-list")
+        data = {"limit": 100}
+        anonime = json.loads(self.anonime.get(url, data=data).content)
+        # count, рецепты, проверка токена и подписки на авторов.
+        queries = self.get_queries(self.authorized, url, data)
+        self.assertEqual(len(queries), 4)
+        Follow.objects.get_or_create(user=cls.user, author=cls.user0)
+        authorized = json.loads(self.authorized.get(url, data=data).content)
+        self.assertEqual(len(anonime["results"]), len(authorized["results"]))
+        favorites = set(
+            Favorite.objects.filter(user=cls.user).values_list("recipe", flat=True)
+        )
+        for shared, recipe in zip(anonime["results"], authorized["results"]):
+            self.assertFalse(shared["is_favorited"])
+            self.assertFalse(shared["author"]["is_subscribed"])
+            self.assertEqual(recipe["is_favorited"], recipe["id"] in favorites)
+            self.assertEqual(
+                recipe["author"]["is_subscribed"],
+                recipe["author"]["id"] == cls.user0.pk,
+            )
+            self.assertEqual(shared["tags"], recipe["tags"])
+            self.assertEqual(shared["ingredients"], recipe["ingredients"])
+        recipe = Recipe.objects.filter(author=cls.user).first()
+        recipe.name = "Новое название"
+        recipe.save()
+        response = self.anonime.get(reverse("recipe-detail", kwargs={"id": recipe.pk}))
+        self.assertEqual(json.loads(response.content)["name"], "Новое название")
+
+    def test_recipes_detail_queries_count(self):
+        """Проверяет число запросов к БД при получении рецепта."""
+        recipe = Amount.objects.last().recipe
+        url = reverse("recipe-detail", kwargs={"id": recipe.pk})
+        for client, count in ((self.anonime, 3), (self.authorized, 5)):
+            with self.subTest(client=client):
+                cache.clear()
+                self.assertEqual(len(self.get_queries(client, url)), count)
+
+    def test_recipes_detail_conditional(self):
+        """
+        Проверяет ответ 304 на рецепт по ETag и Last-Modified и смену ETag
+        при изменении рецепта, его ингредиентов и признаков пользователя.
+        """
+        cls = self.__class__
+        recipe = Recipe.objects.filter(author=cls.user).last()
+        url = reverse("recipe-detail", kwargs={"id": recipe.pk})
+        response = self.anonime.get(url)
+        etag, modified = response["ETag"], response["Last-Modified"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.anonime.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(context.captured_queries), 1)
+        response = self.anonime.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.authorized.get(url)
+        self.assertNotIn("Last-Modified", response)
+        user_etag = response["ETag"]
+        self.assertNotEqual(user_etag, etag)
+        Amount.objects.filter(recipe=recipe).first().delete()
+        response = self.anonime.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.is_recipe(json.loads(response.content))
+        Favorite.objects.filter(recipe=recipe, user=cls.user).delete()
+        response = self.authorized.get(url)
+        user_etag = response["ETag"]
+        self.authorized.post(reverse("recipe-favorite", kwargs={"id": recipe.pk}))
+        response = self.authorized.get(url, HTTP_IF_NONE_MATCH=user_etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(json.loads(response.content)["is_favorited"])
+
+    def test_recipes_list_conditional(self):
+        """
+        Проверяет ответ 304 на список рецептов без загрузки тэгов и
+        ингредиентов и смену ETag при изменении тэга рецепта страницы.
+        """
+        url = reverse("recipe-list")
+        data = {"limit": 3}
+        response = self.anonime.get(url, data=data)
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.anonime.get(url, data=data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        # count и рецепты страницы.
+        self.assertEqual(len(context.captured_queries), 2)
+        response = self.anonime.get(
+            url, data={"limit": 3, "page": 2}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        recipe = Recipe.objects.first()
+        tag = Tag.objects.filter(tag_recipes__recipe=recipe).first()
+        tag.name = "Второй завтрак"
+        tag.save()
+        response = self.anonime.get(url, data=data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        names = [
+            tag["name"]
+            for tag in json.loads(response.content)["results"][0]["tags"]
+        ]
+        self.assertIn("Второй завтрак", names)
+
+    def test_recipes_detail_user_flags(self):
+        """Проверяет признаки избранного и корзины в данных рецепта."""
+        recipe = Trolley.objects.filter(user=self.__class__.user).last().recipe
+        url = reverse("recipe-detail", kwargs={"id": recipe.pk})
+        data = json.loads(self.authorized.get(url).content)
+        self.assertTrue(data.get("is_in_shopping_cart"))
+        self.assertEqual(
+            data.get("is_favorited"),
+            Favorite.objects.filter(recipe=recipe, user=self.__class__.user).exists(),
+        )
+        data = json.loads(self.anonime.get(url).content)
+        self.assertFalse(data.get("is_favorited"))
+        self.assertFalse(data.get("is_in_shopping_cart"))
+
+    def test_recipes_list_with_cursor(self):
+        """
+        Проверяет обход списка рецептов по курсору: рецепты идут по убыванию
+        id без повторов, общее число возвращается только по запросу.
+        """
+        url = reverse("recipe-list")
+        response = self.anonime.get(url, data={"cursor": "", "limit": 5})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = json.loads(response.content)
+        self.assertNotIn("count", data)
+        self.assertIsNone(data.get("previous"))
+        ids = []
+        while True:
+            results = data.get("results")
+            self.assertLessEqual(len(results), 5)
+            ids.extend(recipe.get("id") for recipe in results)
+            if data.get("next") is None:
+                break
+            data = json.loads(self.anonime.get(data.get("next")).content)
+        self.assertEqual(
+            ids, list(Recipe.objects.order_by("-pk").values_list("pk", flat=True))
+        )
+        response = self.anonime.get(url, data={"cursor": "", "count": 1})
+        data = json.loads(response.content)
+        self.assertEqual(data.get("count"), Recipe.objects.count())
+
+    def test_recipes_list_with_cursor_queries(self):
+        """Проверяет что по курсору страница формируется без COUNT запроса."""
+        url = reverse("recipe-list")
+        queries = self.get_queries(self.anonime, url, {"cursor": "", "limit": 5})
+        self.assertFalse([sql for sql in queries if "COUNT(" in sql])
+        queries = self.get_queries(self.anonime, url, {"page": 2, "limit": 5})
+        self.assertTrue([sql for sql in queries if "COUNT(" in sql])
+
+    def cursor_ids(self, url, data):
+        """Собирает id рецептов со всех страниц курсорной пагинации."""
+        data = json.loads(self.anonime.get(url, data=data).content)
+        ids = [recipe.get("id") for recipe in data.get("results")]
+        while data.get("next") is not None:
+            data = json.loads(self.anonime.get(data.get("next")).content)
+            ids.extend(recipe.get("id") for recipe in data.get("results"))
+        return ids
+
+    def test_recipes_ordering(self):
+        """
+        Проверяет сортировки ?ordering=newest и quickest, в том числе по
+        курсору, и неизменный порядок при неизвестном значении.
+        """
+        url = reverse("recipe-list")
+        orderings = {
+            "newest": ("-pub_date", "-pk"),
+            "quickest": ("cooking_time", "-pk"),
+            "unknown": ("-pk",),
+        }
+        for ordering, fields in orderings.items():
+            with self.subTest(ordering=ordering):
+                expected = list(
+                    Recipe.objects.order_by(*fields).values_list("pk", flat=True)
+                )
+                response = self.anonime.get(
+                    url, data={"ordering": ordering, "limit": len(expected)}
+                )
+                results = self.page_paginated(json.loads(response.content))
+                self.assertEqual([recipe["id"] for recipe in results], expected)
+                data = {"ordering": ordering, "cursor": "", "limit": 3}
+                self.assertEqual(self.cursor_ids(url, data), expected)
+
+    def test_recipes_ordering_popular(self):
+        """
+        Проверяет ?ordering=popular: порядок по пересчитанной командой
+        популярности с затуханием старых добавлений и отсутствие запросов к
+        избранному и корзинам при выдаче списка.
+        """
+        url = reverse("recipe-list")
+        users = [
+            User.objects.create(username=f"popular{number}", email=f"p{number}@ya.ru")
+            for number in range(3)
+        ]
+        Favorite.objects.all().delete()
+        Trolley.objects.all().delete()
+        recent, old, cart = Recipe.objects.order_by("pk")[:3]
+        for user in users:
+            Favorite.objects.create(user=user, recipe=recent)
+            Favorite.objects.create(user=user, recipe=old)
+        Favorite.objects.filter(recipe=old).update(
+            created_at=datetime.now(timezone.utc) - timedelta(days=365)
+        )
+        Trolley.objects.create(user=users[0], recipe=cart)
+        out = StringIO()
+        call_command("recompute_popularity", stdout=out)
+        scores = dict(RecipeScore.objects.values_list("recipe", "score"))
+        self.assertFalse(RecipeScore.objects.filter(score__lte=0).exists())
+        self.assertGreater(scores[recent.pk], scores[cart.pk])
+        self.assertGreater(scores[cart.pk], scores[old.pk])
+        expected = list(
+            Recipe.objects.annotate(
+                popularity=Coalesce(F("score__score"), Value(0.0))
+            )
+            .order_by("-popularity", "-pk")
+            .values_list("pk", flat=True)
+        )
+        data = {"ordering": "popular", "limit": len(expected)}
+        response = self.anonime.get(url, data=data)
+        results = self.page_paginated(json.loads(response.content))
+        self.assertEqual([recipe["id"] for recipe in results], expected)
+        data = {"ordering": "popular", "cursor": "", "limit": 2}
+        self.assertEqual(self.cursor_ids(url, data), expected)
+        for table in ("api_favorite", "api_trolley"):
+            with self.subTest(table=table):
+                cache.clear()
+                self.assertEqual(
+                    self.get_queries(self.anonime, url, {"ordering": "popular"}, table),
+                    [],
+                )
+
+    def test_recipes_filter_without_distinct(self):
+        """
+        Проверяет что фильтрация рецептов выполняется полусоединениями без
+        DISTINCT и не размножает рецепты с несколькими тэгами.
+        """
+        cls = self.__class__
+        url = reverse("recipe-list")
+        slugs = [tag.get("slug") for tag in cls.tags]
+        filters = (
+            {"tags": slugs},
+            {"tags": slugs, "is_favorited": 1},
+            {"tags": slugs, "is_favorited": 0, "is_in_shopping_cart": 0},
+            {"is_in_shopping_cart": 1, "author": cls.user.pk},
+        )
+        for data in filters:
+            with self.subTest(data=data):
+                queries = self.get_queries(
+                    self.authorized, url, {**data, "limit": 100}
+                )
+                self.assertFalse([sql for sql in queries if "DISTINCT" in sql])
+                response = self.authorized.get(url, data={**data, "limit": 100})
+                results = json.loads(response.content).get("results")
+                ids = [recipe.get("id") for recipe in results]
+                self.assertEqual(ids, sorted(set(ids), reverse=True))
+        response = self.authorized.get(url, data={"tags": slugs, "limit": 100})
+        self.assertEqual(
+            json.loads(response.content).get("count"),
+            Recipe.objects.filter(tags__isnull=False).distinct().count(),
+        )
+
+    def test_recipes_filter_query_plan(self):
+        """Проверяет план запроса фильтрации рецептов на заполненной БД."""
+        cls = self.__class__
+        recipes = [
+            Recipe(
+                image=None,
+                author=cls.user0,
+                name=f"Рецепт для плана {number}",
+                text=f"Рецепт для плана {number}",
+                cooking_time=1,
+            )
+            for number in range(500)
+        ]
+        Recipe.objects.bulk_create(recipes)
+        recipes = Recipe.objects.filter(author=cls.user0)
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in Tag.objects.all()
+        )
+        Favorite.objects.bulk_create(
+            Favorite(recipe=recipe, user=cls.user) for recipe in recipes[::3]
+        )
+        request = Request(
+            APIRequestFactory().get(
+                reverse("recipe-list"),
+                {
+                    "tags": ("zavtrak", "obed"),
+                    "is_favorited": 0,
+                    "is_in_shopping_cart": 0,
+                },
+            )
+        )
+        request.user = cls.user
+        queryset = RecipeFilter().filter_queryset(request, Recipe.objects.all(), None)
+        plan = queryset.explain()
+        self.assertNotIn("Unique", plan)
+        self.assertNotIn("DISTINCT", str(queryset.query))
+        self.assertEqual(len(queryset), len(set(queryset)))
+
+    def create_search_recipes(self):
+        """Создаёт рецепты для проверки поиска."""
+        cls = self.__class__
+        for name, text in (
+            ("Борщ", "Свёкла, капуста и сметана."),
+            ("Капуста тушёная", "Капуста, морковь."),
+        ):
+            Recipe.objects.create(
+                image=None, author=cls.user0, name=name, text=text, cooking_time=1
+            )
+
+    def test_recipes_search(self):
+        """
+        Проверяет поиск рецептов по ?search=: совпадения с началом названия
+        идут первыми, текст рецепта тоже участвует в поиске.
+        """
+        self.create_search_recipes()
+        url = reverse("recipe-list")
+        response = self.anonime.get(url, data={"search": "капуста"})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = self.page_paginated(json.loads(response.content), count=2)
+        self.assertEqual(
+            [recipe["name"] for recipe in results],
+            ["Капуста тушёная", "Борщ"],
+        )
+        response = self.anonime.get(url, data={"search": "Борщ", "limit": 1})
+        results = self.page_paginated(json.loads(response.content), count=1)
+        self.assertEqual(results[0]["name"], "Борщ")
+        response = self.anonime.get(url, data={"search": "Солянка"})
+        self.page_paginated(json.loads(response.content), count=0)
+
+    @skipUnless(
+        connection.vendor == "postgresql", "Индексы GIN есть только в PostgreSQL."
+    )
+    def test_recipes_search_uses_index(self):
+        """Проверяет, что полнотекстовый поиск выполняется по индексу GIN."""
+        self.create_search_recipes()
+        request = Request(
+            APIRequestFactory().get(reverse("recipe-list"), {"search": "борщи"})
+        )
+        queryset = RecipeSearchFilter().filter_queryset(
+            request, Recipe.objects.all(), None
+        )
+        self.assertEqual([recipe.name for recipe in queryset], ["Борщ"])
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn("recipe_search_vector_idx", queryset.explain())
+
+    def test_explain_queries_command(self):
+        """Проверяет вывод планов основных запросов командой explain_queries."""
+        out = StringIO()
+        call_command("explain_queries", user=self.__class__.user.pk, stdout=out)
+        output = out.getvalue()
+        self.assertIn("Список рецептов с признаками пользователя:", output)
+        self.assertIn("Список покупок:", output)
+        if connection.vendor == "postgresql":
+            # EXPLAIN ANALYZE команда выполняет только в PostgreSQL.
+            self.assertIn("actual time=", output)
+
     def test_receipes_list_with_paginations(self):
         """Проверяет получение списка рецептов с пагинацией."""
         url = reverse("recipe-list")
@@ -743,11 +1555,12 @@ class RecipeTestCase(BaseTestCase):
 
     def test_receipes_detail(self):
         """Проверяет возможность получить данные рецепта."""
-        url = reverse("recipe-detail", kwargs={"id": 1})
+        recipe_id = Recipe.objects.order_by("pk").first().pk
+        url = reverse("recipe-detail", kwargs={"id": recipe_id})
         response = self.anonime.get(url)
         data = json.loads(response.content)
         self.is_recipe(data)
-        self.assertEqual(data.get("id"), 1)
+        self.assertEqual(data.get("id"), recipe_id)
 
     def test_receipes_create(self):
         """Проверяет возможность создать рецепт."""
@@ -800,6 +1613,59 @@ class RecipeTestCase(BaseTestCase):
         self.assertIsInstance(ingredients, list)
         self.assertEqual(ingredients[0].get("id"), ingredient.pk)
 
+    def test_recipes_save_queries_count(self):
+        """
+        Проверяет что число запросов к БД при создании и изменении рецепта не
+        зависит от числа ингредиентов.
+        """
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(50)
+        )
+        ingredients = list(Ingredient.objects.order_by("-pk")[:50])
+        tag = Tag.objects.first()
+        image = (
+            "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAA"
+            "ADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+        )
+
+        def save(method, url, count, shift=0):
+            data = {
+                "ingredients": [
+                    {"id": ingredient.pk, "amount": pos + 1}
+                    for pos, ingredient in enumerate(ingredients[shift:][:count])
+                ],
+                "tags": [tag.pk],
+                "image": image,
+                "name": f"Рецепт из {count} ингредиентов",
+                "text": f"Рецепт из {count} ингредиентов",
+                "cooking_time": 10,
+            }
+            with CaptureQueriesContext(connection) as context:
+                response = method(url, data=data, format="json")
+            self.assertIn(response.status_code, (HTTPStatus.CREATED, HTTPStatus.OK))
+            recipe_id = json.loads(response.content).get("id")
+            self.assertEqual(Amount.objects.filter(recipe_id=recipe_id).count(), count)
+            return recipe_id, len(context.captured_queries)
+
+        url = reverse("recipe-list")
+        small_id, small = save(self.authorized.post, url, 5)
+        large_id, large = save(self.authorized.post, url, 40)
+        self.assertEqual(small, large)
+        small = save(
+            self.authorized.patch,
+            reverse("recipe-detail", kwargs={"id": small_id}),
+            5,
+            shift=2,
+        )[1]
+        large = save(
+            self.authorized.patch,
+            reverse("recipe-detail", kwargs={"id": large_id}),
+            40,
+            shift=5,
+        )[1]
+        self.assertEqual(small, large)
+
     def test_receipes_create_validation_error(self):
         """Проверяет блокирование создания рецепта с некорректными данными."""
         url = reverse("recipe-list")
@@ -1243,6 +2109,238 @@ class RecipeTestCase(BaseTestCase):
         response = self.authorized.get(url)
         self.assertEqual(response.status_code, HTTPStatus.OK)
 
+    def test_download_shopping_cart_formats(self):
+        """Проверяет выгрузку списка покупок во всех форматах."""
+        url = reverse("recipe-download-shopping-cart")
+        expected = list(
+            humanize_rows(ShoppingList.objects.totals_for_user(self.__class__.user))
+        )
+        self.assertTrue(expected)
+        contents = {}
+        for file_format, content_type in (
+            ("txt", "text/plain; charset=utf-8"),
+            ("csv", "text/csv; charset=utf-8"),
+            ("json", "application/json"),
+        ):
+            with self.subTest(file_format=file_format):
+                response = self.authorized.get(url, data={"format": file_format})
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.streaming)
+                self.assertEqual(response["Content-Type"], content_type)
+                self.assertIn(
+                    f'filename="shopping_cart.{file_format}"',
+                    response["Content-Disposition"],
+                )
+                contents[file_format] = b"".join(response.streaming_content)
+        lines = contents["txt"].decode().splitlines()
+        self.assertEqual(len(lines), len(expected) + 1)
+        name, amount = lines[1].split(": ", 1)[1].rsplit(", ", 1)
+        amount, unit = amount.split(" ", 1)
+        self.assertEqual((name, Decimal(amount), unit), expected[0])
+        rows = list(csv.reader(contents["csv"].decode().splitlines()))
+        self.assertEqual(rows[0], ["name", "amount", "measurement_unit"])
+        self.assertEqual(
+            [(name, Decimal(amount), unit) for name, amount, unit in rows[1:]],
+            expected,
+        )
+        self.assertEqual(
+            [
+                (item["name"], Decimal(item["amount"]), item["measurement_unit"])
+                for item in json.loads(contents["json"])
+            ],
+            expected,
+        )
+
+    @skipUnless(
+        os.path.exists(settings.SHOPPING_CART_PDF_FONT), "Нет шрифта для выгрузки в PDF"
+    )
+    def test_download_shopping_cart_pdf(self):
+        """
+        Проверяет выгрузку в PDF: в документ встраивается подмножество
+        шрифта, а без шрифта с кириллицей выгрузка отвечает ошибкой.
+        """
+        url = reverse("recipe-download-shopping-cart")
+        response = self.authorized.get(url, data={"format": "pdf"})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        content = b"".join(response.streaming_content)
+        self.assertTrue(content.startswith(b"%PDF-"))
+        self.assertIn(b"%%EOF", content[-16:])
+        self.assertLess(
+            len(content), os.path.getsize(settings.SHOPPING_CART_PDF_FONT) // 10
+        )
+        import reportlab
+
+        latin = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+        for font in (latin, os.path.join(settings.BASE_DIR, "missing.ttf"), ""):
+            with self.subTest(font=font), self.settings(SHOPPING_CART_PDF_FONT=font):
+                response = self.authorized.get(url, data={"format": "pdf"})
+                self.assertEqual(
+                    response.status_code, HTTPStatus.SERVICE_UNAVAILABLE
+                )
+                self.assertIn("errors", json.loads(response.content))
+
+    def test_download_shopping_cart_units(self):
+        """
+        Проверяет что выгрузка складывает количества ингредиента в разных
+        единицах одной величины и выводит суммы в удобных единицах.
+        """
+        user = self.__class__.user
+        Trolley.objects.filter(user=user).delete()
+        ShoppingList.objects.filter(user=user).delete()
+        recipes = [
+            Recipe.objects.create(
+                image=None,
+                author=user,
+                name=f"Рецепт в единицах {number}",
+                text="Рецепт в единицах",
+                cooking_time=1,
+            )
+            for number in range(2)
+        ]
+        for recipe, name, unit, amount in (
+            (recipes[0], "Единицы мука", "г", 700),
+            (recipes[1], "Единицы мука", "кг", "0.8"),
+            (recipes[0], "Единицы молоко", "мл", 200),
+            (recipes[0], "Единицы молоко", "ст. л.", 2),
+            (recipes[1], "Единицы молоко", "стакан", 1),
+            (recipes[0], "Единицы сахар", "ст. л.", 1),
+            (recipes[1], "Единицы сахар", "ст. л.", 2),
+            (recipes[0], "Единицы соль", "по вкусу", 1),
+            (recipes[0], "Единицы яйца", "шт", 2),
+            (recipes[1], "Единицы яйца", "шт.", 1),
+            (recipes[1], "Единицы ваниль", "г", "0.5"),
+        ):
+            ingredient, _ = Ingredient.objects.get_or_create(
+                name=name, measurement_unit=unit
+            )
+            Amount.objects.create(recipe=recipe, ingredient=ingredient, amount=amount)
+        url = reverse("recipe-shopping-cart-bulk")
+        response = self.authorized.post(
+            url, {"ids": [recipe.pk for recipe in recipes]}, format="json"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.authorized.get(
+            reverse("recipe-download-shopping-cart"), data={"format": "json"}
+        )
+        items = json.loads(b"".join(response.streaming_content))
+        response = self.authorized.get(reverse("recipe-shopping-list"))
+        self.assertEqual(json.loads(response.content), items)
+        self.assertEqual(
+            [
+                (item["name"], item["amount"], item["measurement_unit"])
+                for item in items
+            ],
+            [
+                ("Единицы ваниль", "500.00", "мг"),
+                ("Единицы молоко", "480.00", "мл"),
+                ("Единицы мука", "1.50", "кг"),
+                ("Единицы сахар", "3.00", "ст. л."),
+                ("Единицы соль", "1.00", "по вкусу"),
+                ("Единицы яйца", "3.00", "шт."),
+            ],
+        )
+
+    def test_shopping_list(self):
+        """
+        Проверяет что список покупок обновляется при изменении корзины,
+        ингредиентов рецепта в корзине и удалении рецепта.
+        """
+        cls = self.__class__
+        user = cls.user
+        self.is_shopping_list_actual(user)
+        recipe = Recipe.objects.create(
+            image=None,
+            author=user,
+            name="Рецепт для списка покупок",
+            text="Рецепт для списка покупок",
+            cooking_time=1,
+        )
+        Amount.objects.create(
+            recipe=recipe, ingredient=Ingredient.objects.first(), amount=3
+        )
+        url = reverse("recipe-shopping-cart", kwargs={"id": recipe.pk})
+        self.assertEqual(self.authorized.post(url).status_code, HTTPStatus.CREATED)
+        self.is_shopping_list_actual(user)
+        Trolley.objects.create(recipe=recipe, user=cls.user0)
+        ShoppingList.objects.add_recipe(cls.user0, recipe)
+        self.is_shopping_list_actual(cls.user0)
+
+        ingredients = Ingredient.objects.all()[:3]
+        response = self.authorized.patch(
+            reverse("recipe-detail", kwargs={"id": recipe.pk}),
+            data={
+                "ingredients": [
+                    {"id": ingredient.pk, "amount": pos + 5}
+                    for pos, ingredient in enumerate(ingredients)
+                ],
+                "tags": [Tag.objects.first().pk],
+                "name": recipe.name,
+                "text": recipe.text,
+                "cooking_time": recipe.cooking_time,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.is_shopping_list_actual(user)
+        self.is_shopping_list_actual(cls.user0)
+
+        response = self.authorized.get(reverse("recipe-shopping-list"))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [
+                (item["name"], Decimal(item["amount"]), item["measurement_unit"])
+                for item in json.loads(response.content)
+            ],
+            list(humanize_rows(ShoppingList.objects.totals_for_user(user))),
+        )
+
+        self.assertEqual(self.authorized.delete(url).status_code, HTTPStatus.NO_CONTENT)
+        self.is_shopping_list_actual(user)
+        self.assertEqual(self.authorized.delete(url).status_code, HTTPStatus.NO_CONTENT)
+        self.is_shopping_list_actual(user)
+        Recipe.objects.get(pk=recipe.pk).delete()
+        self.is_shopping_list_actual(cls.user0)
+
+    def test_shopping_list_apply(self):
+        """
+        Проверяет что apply прибавляет изменения к существующим строкам,
+        создаёт недостающие и удаляет строки с нулевым остатком одним
+        запросом изменения.
+        """
+        user = self.__class__.user0
+        ShoppingList.objects.filter(user=user).delete()
+        first, second, third = Ingredient.objects.all()[:3]
+        ShoppingList.objects.create(user=user, ingredient=first, amount=5)
+        ShoppingList.objects.create(user=user, ingredient=second, amount=2)
+        with self.assertNumQueries(4):
+            ShoppingList.objects.apply(
+                {
+                    (user.pk, first.pk): Decimal(3),
+                    (user.pk, second.pk): Decimal(-2),
+                    (user.pk, third.pk): Decimal("1.5"),
+                }
+            )
+        self.assertEqual(
+            dict(
+                ShoppingList.objects.filter(user=user).values_list(
+                    "ingredient", "amount"
+                )
+            ),
+            {first.pk: Decimal(8), third.pk: Decimal("1.5")},
+        )
+
+    def test_shopping_list_anonime(self):
+        """Проверяет блокировку получения списка покупок анонимом."""
+        response = self.anonime.get(reverse("recipe-shopping-list"))
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_download_shopping_cart_wrong_format(self):
+        """Проверяет выгрузку списка покупок в неизвестном формате."""
+        url = reverse("recipe-download-shopping-cart")
+        response = self.authorized.get(url, data={"format": "xls"})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
     def test_download_shopping_cart_anonime(self):
         """
         Проверяет блокировку попытки получения списка покупок анонимным
@@ -1329,6 +2427,273 @@ class RecipeTestCase(BaseTestCase):
         response = self.anonime.delete(url)
         self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
 
+    def new_recipes(self, count, name):
+        recipes = [
+            Recipe.objects.create(
+                image="test.img",
+                author=self.__class__.user0,
+                name=f"{name} {number}",
+                text=name,
+                cooking_time=1,
+            )
+            for number in range(count)
+        ]
+        ingredients = list(Ingredient.objects.all()[:2])
+        for recipe in recipes:
+            for ingredient in ingredients:
+                Amount.objects.create(recipe=recipe, ingredient=ingredient, amount=2)
+        return [recipe.pk for recipe in recipes]
+
+    def test_shopping_cart_bulk(self):
+        """
+        Проверяет добавление и удаление списка рецептов в корзину: результат
+        по каждому id, актуальность списка покупок и число запросов к БД,
+        не зависящее от длины списка.
+        """
+        user = self.__class__.user
+        url = reverse("recipe-shopping-cart-bulk")
+        pks = self.new_recipes(3, "Рецепт для пакетной корзины")
+        added = Trolley.objects.filter(user=user).first().recipe_id
+        missing = Recipe.objects.order_by("pk").last().pk + 1
+        ids = [*pks, added, missing, pks[0]]
+        for method in (self.authorized.post, self.authorized.delete):
+            response = method(url, {"ids": ids}, format="json")
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.is_shopping_list_actual(user)
+            self.is_shopping_list_actual(self.__class__.user0)
+            results = json.loads(response.content)["results"]
+            self.assertEqual([result["id"] for result in results], ids[:-1])
+            statuses = [result["status"] for result in results]
+            if method == self.authorized.post:
+                self.assertEqual(statuses, ["added"] * 3 + ["exists", "not_found"])
+                self.assertEqual(
+                    Trolley.objects.filter(user=user, recipe__in=pks).count(), 3
+                )
+            else:
+                self.assertEqual(statuses, ["deleted"] * 4 + ["not_found"])
+                self.assertFalse(
+                    Trolley.objects.filter(user=user, recipe__in=ids).exists()
+                )
+        # Первый рецепт добавляет строки ингредиентов в список покупок,
+        # дальше списки любой длины только обновляют их.
+        pks = self.new_recipes(12, "Ещё рецепт для пакетной корзины")
+        queries = []
+        for ids in (pks[:1], pks[1:3], pks[3:]):
+            with CaptureQueriesContext(connection) as context:
+                self.authorized.post(url, {"ids": ids}, format="json")
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[1], queries[2])
+        self.is_shopping_list_actual(user)
+        response = self.authorized.delete(f"{url}?ids={pks[0]},{pks[1]}")
+        results = json.loads(response.content)["results"]
+        statuses = [result["status"] for result in results]
+        self.assertEqual(statuses, ["deleted", "deleted"])
+        self.is_shopping_list_actual(user)
+
+    def test_counters(self):
+        """
+        Проверяет, что счётчики рецепта и пользователей меняются вместе с
+        избранным, корзиной, подписками и рецептами.
+        """
+        author = User.objects.create(username="counters", email="counters@ya.ru")
+        recipe = Recipe.objects.create(
+            image="test.img",
+            author=author,
+            name="Рецепт для счётчиков",
+            text="Рецепт для счётчиков",
+            cooking_time=1,
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 1)
+        for name, counter in (
+            ("recipe-favorite", "favorites_count"),
+            ("recipe-shopping-cart", "carts_count"),
+        ):
+            with self.subTest(name=name):
+                url = reverse(name, kwargs={"id": recipe.pk})
+                self.authorized.post(url)
+                self.authorized.post(url)
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 1)
+                self.authorized.delete(url)
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 0)
+                self.authorized.post(
+                    reverse(f"{name}-bulk"), {"ids": [recipe.pk]}, format="json"
+                )
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 1)
+        url = reverse("user-subscribe", kwargs={"id": author.pk})
+        self.authorized.post(url)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.authorized.delete(url)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 0)
+        recipe.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+
+    def test_recount(self):
+        """Проверяет исправление разошедшихся счётчиков командой recount."""
+        Recipe.objects.update(favorites_count=100, carts_count=0)
+        User.objects.update(recipes_count=0, followers_count=7)
+        out = StringIO()
+        call_command("recount", dry_run=True, stdout=out)
+        self.assertTrue(Recipe.objects.filter(favorites_count=100).exists())
+        call_command("recount", stdout=out)
+        for model, field, related, related_field in COUNTERS:
+            with self.subTest(field=field):
+                for pk, value in model.objects.values_list("pk", field):
+                    self.assertEqual(
+                        value, related.objects.filter(**{related_field: pk}).count()
+                    )
+
+    def cart_recipe(self, user, amount=2):
+        """Рецепт нового автора с одним ингредиентом в корзине user."""
+        author = User.objects.create(
+            username=f"cart{Recipe.objects.count()}",
+            email=f"cart{Recipe.objects.count()}@ya.ru",
+        )
+        recipe = Recipe.objects.create(
+            image=None, author=author, name="В корзине", text="В корзине"
+        )
+        Amount.objects.create(
+            recipe=recipe, ingredient=Ingredient.objects.first(), amount=amount
+        )
+        Trolley.objects.create(user=user, recipe=recipe)
+        ShoppingList.objects.add_recipe(user, recipe)
+        return recipe
+
+    def test_shopping_list_cascade_delete(self):
+        """
+        Проверяет что списки покупок и счётчик рецептов автора обновляются
+        при удалении рецепта вместе с автором и через QuerySet.
+        """
+        user = self.__class__.user0
+        recipe = self.cart_recipe(user)
+        recipe.author.delete()
+        self.assertFalse(Trolley.objects.filter(recipe=recipe).exists())
+        self.is_shopping_list_actual(user)
+
+        recipe = self.cart_recipe(user)
+        author = recipe.author
+        Recipe.objects.filter(pk=recipe.pk).delete()
+        self.is_shopping_list_actual(user)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+
+    def test_shopping_list_admin(self):
+        """
+        Проверяет пересчёт списков покупок при изменении корзин и
+        ингредиентов рецептов в админке.
+        """
+        user = self.__class__.user0
+        request = RequestFactory().post("/")
+        recipe = self.cart_recipe(user)
+        trolley_admin = admin.site._registry[Trolley]
+        amount_admin = admin.site._registry[Amount]
+
+        amount = Amount.objects.get(recipe=recipe)
+        amount.amount = 7
+        amount_admin.save_model(request, amount, None, True)
+        self.is_shopping_list_actual(user)
+        amount_admin.delete_queryset(request, Amount.objects.filter(pk=amount.pk))
+        self.is_shopping_list_actual(user)
+
+        amount = Amount(recipe=recipe, ingredient=Ingredient.objects.last(), amount=3)
+        amount_admin.save_model(request, amount, None, False)
+        self.is_shopping_list_actual(user)
+        trolley = Trolley.objects.get(user=user, recipe=recipe)
+        trolley_admin.delete_model(request, trolley)
+        self.is_shopping_list_actual(user)
+        trolley = Trolley(user=user, recipe=recipe)
+        trolley_admin.save_model(request, trolley, None, False)
+        self.is_shopping_list_actual(user)
+        trolley_admin.delete_queryset(request, Trolley.objects.filter(pk=trolley.pk))
+        self.is_shopping_list_actual(user)
+
+    def test_rebuild_shopping_lists(self):
+        """Проверяет пересчёт списков покупок командой rebuild_shopping_lists."""
+        cls = self.__class__
+        expected = set(ShoppingList.objects.values_list("user", "ingredient", "amount"))
+        ShoppingList.objects.filter(user=cls.user).update(amount=100)
+        ShoppingList.objects.filter(user=cls.user0).delete()
+        call_command("rebuild_shopping_lists", users=[cls.user.pk], stdout=StringIO())
+        self.assertFalse(ShoppingList.objects.filter(user=cls.user0).exists())
+        call_command("rebuild_shopping_lists", stdout=StringIO())
+        self.assertEqual(
+            set(ShoppingList.objects.values_list("user", "ingredient", "amount")),
+            expected,
+        )
+
+    def test_shopping_cart_bulk_wrong_ids(self):
+        """Проверяет ошибки при неверном списке id и доступ анонима."""
+        url = reverse("recipe-shopping-cart-bulk")
+        for ids in ([], ["a"], [-1], "1,2", None):
+            with self.subTest(ids=ids):
+                response = self.authorized.post(url, {"ids": ids}, format="json")
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                self.assertIn("errors", json.loads(response.content))
+        with self.settings(RECIPE_BATCH_LIMIT=2):
+            response = self.authorized.post(url, {"ids": [1, 2, 3]}, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.anonime.post(url, {"ids": [1]}, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    @skipUnless(
+        connection.features.has_select_for_update, "СУБД без SELECT ... FOR UPDATE."
+    )
+    def test_favorite_cart_lock_user(self):
+        """
+        Проверяет что одиночные и пакетные запросы избранного и корзины
+        блокируют строку пользователя: одновременные запросы одного
+        пользователя выполняются по очереди.
+        """
+        pks = self.new_recipes(2, "Рецепт для блокировки пользователя")
+        table = connection.ops.quote_name(User._meta.db_table)
+        for url, data in (
+            (reverse("recipe-shopping-cart", kwargs={"id": pks[0]}), None),
+            (reverse("recipe-favorite", kwargs={"id": pks[0]}), None),
+            (reverse("recipe-shopping-cart-bulk"), {"ids": pks}),
+            (reverse("recipe-favorite-bulk"), {"ids": pks}),
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as context:
+                    self.authorized.post(url, data, format="json")
+                self.assertTrue(
+                    [
+                        query["sql"]
+                        for query in context.captured_queries
+                        if f"FROM {table}" in query["sql"]
+                        and "FOR UPDATE" in query["sql"]
+                    ]
+                )
+
+    def test_favorite_bulk(self):
+        """Проверяет добавление и удаление списка рецептов в избранное."""
+        user = self.__class__.user
+        url = reverse("recipe-favorite-bulk")
+        pks = self.new_recipes(2, "Рецепт для пакетного избранного")
+        Favorite.objects.create(user=user, recipe_id=pks[0])
+        response = self.authorized.post(url, {"ids": pks}, format="json")
+        results = json.loads(response.content)["results"]
+        statuses = [result["status"] for result in results]
+        self.assertEqual(statuses, ["exists", "added"])
+        self.assertEqual(Favorite.objects.filter(user=user, recipe__in=pks).count(), 2)
+        response = self.authorized.delete(url, {"ids": pks[1:]}, format="json")
+        results = json.loads(response.content)["results"]
+        statuses = [result["status"] for result in results]
+        self.assertEqual(statuses, ["deleted"])
+        self.assertEqual(
+            list(
+                Favorite.objects.filter(user=user, recipe__in=pks).values_list(
+                    "recipe", flat=True
+                )
+            ),
+            pks[:1],
+        )
+
     def test_favorite_add(self):
         """
         Проверяет возможность добавления рецепта в список избранных рецептов.
@@ -1390,3 +2755,395 @@ class RecipeTestCase(BaseTestCase):
         response = self.authorized.delete(url)
         self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
         self.assertFalse(Favorite.objects.filter(pk=favorite.pk).exists())
+
+
+class FeedTestCase(BaseTestCase):
+    def subscribe(self, author, method="post"):
+        url = reverse("user-subscribe", kwargs={"id": author.pk})
+        response = getattr(self.authorized, method)(url)
+        self.assertIn(response.status_code, (HTTPStatus.CREATED, HTTPStatus.NO_CONTENT))
+
+    def feed_ids(self):
+        """Собирает id рецептов ленты со всех страниц курсора."""
+        response = self.authorized.get(reverse("recipe-feed"), data={"limit": 1})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        data = json.loads(response.content)
+        ids = [recipe.get("id") for recipe in data.get("results")]
+        while data.get("next") is not None:
+            data = json.loads(self.authorized.get(data.get("next")).content)
+            self.assertLessEqual(len(data.get("results")), 1)
+            ids.extend(recipe.get("id") for recipe in data.get("results"))
+        return ids
+
+    def test_feed(self):
+        """
+        Проверяет ленту подписок: рецепты разосланные при публикации и
+        читаемые из подписок у автора с большим числом подписчиков, порядок
+        от новых, отписку и заполнение ленты при повторной подписке.
+        """
+        user = self.__class__.user
+        author, celebrity, stranger = (
+            User.objects.create(username=f"feed{number}", email=f"f{number}@ya.ru")
+            for number in range(3)
+        )
+        before = self.create_recipe(author, "Рецепт до подписки")
+        self.subscribe(author)
+        self.subscribe(celebrity)
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            read = self.create_recipe(celebrity, "Рецепт из подписок")
+        fanned = self.create_recipe(author, "Разосланный рецепт")
+        self.create_recipe(stranger, "Рецепт без подписки")
+        self.assertFalse(read.fanned_out)
+        self.assertTrue(fanned.fanned_out)
+        self.assertEqual(
+            set(
+                TimelineEntry.objects.filter(user=user).values_list(
+                    "recipe", flat=True
+                )
+            ),
+            {before.pk, fanned.pk},
+        )
+        self.assertEqual(self.feed_ids(), [fanned.pk, read.pk, before.pk])
+        self.subscribe(author, "delete")
+        self.assertFalse(TimelineEntry.objects.filter(user=user).exists())
+        self.assertEqual(self.feed_ids(), [read.pk])
+        self.subscribe(author)
+        self.assertEqual(self.feed_ids(), [fanned.pk, read.pk, before.pk])
+
+    def test_feed_not_modified(self):
+        """Проверяет ETag ленты и доступ к ней только авторизованным."""
+        url = reverse("recipe-feed")
+        response = self.authorized.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.authorized.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.anonime.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class PantryTestCase(BaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username="pantry", email="pantry@ya.ru")
+        cls.products = {
+            name: Ingredient.objects.create(
+                name=f"Продукт {name}", measurement_unit="г"
+            )
+            for name in "abcde"
+        }
+        cls.recipes = {
+            products: cls.create_recipe(
+                cls.author, f"Рецепт из {products}", map(cls.products.get, products)
+            )
+            for products in ("ab", "abcd", "c", "e")
+        }
+
+    def setUp(self):
+        super().setUp()
+        pantry_index.clear()
+
+    def pantry(self, products, client=None):
+        response = (client or self.authorized).post(
+            reverse("recipe-pantry"),
+            {"ingredients": [self.products[name].pk for name in products]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return json.loads(response.content)["results"]
+
+    def test_pantry(self):
+        """
+        Проверяет подбор рецептов по продуктам: порядок по покрытию, затем
+        по числу имеющихся продуктов, и список недостающих ингредиентов.
+        """
+        results = self.pantry("abc", self.anonime)
+        recipes = self.__class__.recipes
+        self.assertEqual(
+            [(recipe["id"], recipe["coverage"]) for recipe in results],
+            [
+                (recipes["ab"].pk, 1),
+                (recipes["c"].pk, 1),
+                (recipes["abcd"].pk, 0.75),
+            ],
+        )
+        self.assertEqual([recipe["missing"] for recipe in results[:2]], [[], []])
+        product = self.products["d"]
+        self.assertEqual(
+            results[2]["missing"],
+            [
+                {
+                    "id": product.pk,
+                    "name": product.name,
+                    "measurement_unit": product.measurement_unit,
+                }
+            ],
+        )
+        self.is_recipe(results[0])
+        response = self.anonime.post(
+            f"{reverse('recipe-pantry')}?limit=1",
+            {"ingredients": [self.products["a"].pk]},
+            format="json",
+        )
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+    def test_pantry_without_amount_queries(self):
+        """
+        Проверяет что повторный подбор не читает Amount: рецепты ищутся по
+        индексу, их данные берутся из кэша.
+        """
+        self.pantry("abcde")
+        url = reverse("recipe-pantry")
+        data = {"ingredients": [product.pk for product in self.products.values()]}
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized.post(url, data, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in context.captured_queries
+                if '"api_amount"' in query["sql"]
+            ]
+        )
+
+    def test_pantry_index_updates(self):
+        """
+        Проверяет обновление индекса при сохранении и удалении рецепта после
+        фиксации транзакции.
+        """
+        self.pantry("e")
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe(
+                self.author, "Рецепт из de", map(self.products.get, "de")
+            )
+        self.assertEqual(
+            [(item["id"], item["coverage"]) for item in self.pantry("e")],
+            [(self.__class__.recipes["e"].pk, 1), (recipe.pk, 0.5)],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Amount.objects.filter(recipe=recipe, ingredient=self.products["d"]).update(
+                ingredient=self.products["a"]
+            )
+            recipe.save()
+        self.assertEqual(self.pantry("ae")[0]["id"], recipe.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertNotIn(recipe.pk, [item["id"] for item in self.pantry("ae")])
+
+    def test_pantry_index_single_refresh(self):
+        """
+        Проверяет что изменение ингредиентов рецепта через API удаляет
+        лишние строки одним запросом и обновляет индексы одним обработчиком
+        после фиксации транзакции.
+        """
+        recipe = self.create_recipe(
+            self.author, "Рецепт из abcde", map(self.products.get, "abcde")
+        )
+        recipe.author = self.__class__.user
+        recipe.save()
+        tag = Tag.objects.create(name="Кладовая", color="#000000", slug="pantry")
+        url = reverse("recipe-detail", kwargs={"id": recipe.pk})
+        data = {
+            "ingredients": [{"id": self.products["a"].pk, "amount": 1}],
+            "tags": [tag.pk],
+            "name": recipe.name,
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+        }
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(
+            connection
+        ) as context:
+            response = self.authorized.patch(url, data, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            len(
+                [
+                    query["sql"]
+                    for query in context.captured_queries
+                    if query["sql"].startswith('DELETE FROM "api_amount"')
+                ]
+            ),
+            1,
+        )
+        self.pantry("a")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.pantry("a")[0]["id"], recipe.pk)
+
+    def test_pantry_index_stale(self):
+        """
+        Проверяет что во время перестройки устаревшего индекса запросы не
+        ждут её и получают прежние данные, а перестройка добавляет рецепты,
+        сохранённые мимо сигналов.
+        """
+        self.pantry("e")
+        recipe = self.create_recipe(
+            self.author, "Рецепт из e", map(self.products.get, "e")
+        )
+        pantry_index.built_at -= settings.PANTRY_INDEX_TTL + 1
+        with pantry_index.build_lock:
+            self.assertNotIn(recipe.pk, [item["id"] for item in self.pantry("e")])
+        pantry_index.build()
+        self.assertIn(recipe.pk, [item["id"] for item in self.pantry("e")])
+
+    def test_pantry_wrong_ingredients(self):
+        """Проверяет ошибки при неверном или слишком длинном списке."""
+        url = reverse("recipe-pantry")
+        for ingredients in ([], ["a"], "1,2", None):
+            with self.subTest(ingredients=ingredients):
+                response = self.authorized.post(
+                    url, {"ingredients": ingredients}, format="json"
+                )
+                self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+                self.assertIn("errors", json.loads(response.content))
+        with self.settings(PANTRY_INGREDIENTS_LIMIT=1):
+            response = self.authorized.post(
+                url, {"ingredients": [1, 2]}, format="json"
+            )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+@skipUnless(similarity_index.is_available(), "Не установлены numpy и scipy")
+class SimilarTestCase(BaseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username="similar", email="similar@ya.ru")
+        cls.products = {
+            name: Ingredient.objects.create(
+                name=f"Похожий {name}", measurement_unit="г"
+            )
+            for name in "abcde"
+        }
+        cls.labels = {
+            name: Tag.objects.create(name=f"Тэг {name}", color="#000000", slug=name)
+            for name in ("first", "second")
+        }
+        cls.recipes = [
+            cls.create_recipe(
+                cls.author,
+                f"Похожий рецепт {products}",
+                map(cls.products.get, products),
+                [cls.labels[tag]],
+            )
+            for products, tag in (
+                ("abc", "first"),
+                ("abd", "first"),
+                ("a", "second"),
+                ("e", "second"),
+                ("bcd", "first"),
+            )
+        ]
+
+    def setUp(self):
+        super().setUp()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "similarity.npz")
+        override = self.settings(SIMILAR_MATRIX_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        similarity_index.clear()
+        self.addCleanup(similarity_index.clear)
+
+    def expected(self, recipe):
+        """Косинусная близость рецепта к остальным, посчитанная напрямую."""
+
+        def vector(recipe):
+            weight = float(settings.SIMILAR_TAG_WEIGHT)
+            features = {
+                ("ingredient", pk): 1.0
+                for pk in recipe.ingredients.values_list("ingredient", flat=True)
+            }
+            features.update(
+                {
+                    ("tag", pk): weight
+                    for pk in recipe.tags.values_list("tag", flat=True)
+                }
+            )
+            return features
+
+        def cosine(first, second):
+            dot = sum(value * second.get(key, 0) for key, value in first.items())
+            return dot / sqrt(sum(v * v for v in first.values())) / sqrt(
+                sum(v * v for v in second.values())
+            )
+
+        source = vector(recipe)
+        scores = [
+            (other.pk, round(cosine(source, vector(other)), 4))
+            for other in Recipe.objects.exclude(pk=recipe.pk)
+            if other.ingredients.exists() or other.tags.exists()
+        ]
+        return sorted(
+            ((pk, score) for pk, score in scores if score > 0),
+            key=lambda item: (-item[1], -item[0]),
+        )
+
+    def similar(self, recipe, data=None):
+        url = reverse("recipe-similar", kwargs={"id": recipe.pk})
+        response = self.anonime.get(url, data=data)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            (item["id"], item["similarity"])
+            for item in json.loads(response.content)["results"]
+        ]
+
+    def test_similar(self):
+        """
+        Проверяет похожие рецепты: близость и порядок совпадают с прямым
+        расчётом, рецепт не похож сам на себя, ?limit= ограничивает ответ.
+        """
+        for recipe in self.__class__.recipes:
+            with self.subTest(recipe=recipe.name):
+                self.assertEqual(self.similar(recipe), self.expected(recipe))
+        recipe = self.__class__.recipes[0]
+        self.assertEqual(
+            self.similar(recipe, {"limit": 1}), self.expected(recipe)[:1]
+        )
+        missing = Recipe.objects.order_by("pk").last().pk + 1
+        response = self.anonime.get(reverse("recipe-similar", kwargs={"id": missing}))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_similar_updates(self):
+        """
+        Проверяет обновление похожих при создании, изменении и удалении
+        рецепта после фиксации транзакции без копирования матрицы и сброс
+        изменений при перестройке.
+        """
+        first = self.__class__.recipes[0]
+        self.similar(first)
+        matrix = similarity_index.matrix
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = self.create_recipe(
+                self.author,
+                "Похожий рецепт abc",
+                map(self.products.get, "abc"),
+                [self.labels["first"]],
+            )
+        self.assertEqual(self.similar(first)[0], (copy.pk, 1.0))
+        with self.captureOnCommitCallbacks(execute=True):
+            TagRecipe.objects.filter(recipe=copy).delete()
+            copy.save()
+            first.save()
+        self.assertEqual(self.similar(copy), self.expected(copy))
+        self.assertEqual(self.similar(first), self.expected(first))
+        self.assertIs(similarity_index.matrix, matrix)
+        similarity_index.build()
+        self.assertEqual(similarity_index.overlay, {})
+        self.assertEqual(self.similar(copy), self.expected(copy))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertNotIn(copy.pk, [pk for pk, _ in self.similar(first)])
+
+    def test_build_similarity(self):
+        """
+        Проверяет что команда build_similarity сохраняет матрицу, а индекс
+        загружает её из файла.
+        """
+        call_command("build_similarity", stdout=StringIO())
+        self.assertTrue(os.path.exists(self.path))
+        recipe = self.__class__.recipes[1]
+        self.assertEqual(self.similar(recipe), self.expected(recipe))
+        self.assertEqual(
+            similarity_index.loaded_mtime, os.path.getmtime(self.path)
+        )
@@ -0,0 +1,85 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Case, CharField, DecimalField, F, Value, When
+
+# Единица измерения ингредиента: (основная единица, во сколько раз она
+# больше основной). Количества в единицах одной основной единицы
+# складываются, остальные единицы ("по вкусу", "пучок") не переводятся.
+UNITS = {
+    "мг": ("г", Decimal("0.001")),
+    "г": ("г", Decimal(1)),
+    "кг": ("г", Decimal(1000)),
+    "мл": ("мл", Decimal(1)),
+    "л": ("мл", Decimal(1000)),
+    "ч. л.": ("мл", Decimal(5)),
+    "ст. л.": ("мл", Decimal(15)),
+    "стакан": ("мл", Decimal(250)),
+    "шт": ("шт.", Decimal(1)),
+    "шт.": ("шт.", Decimal(1)),
+}
+
+# Единицы вывода количества в основной единице, от крупной к мелкой.
+DISPLAY_UNITS = {
+    "г": (("кг", Decimal(1000)), ("г", Decimal(1)), ("мг", Decimal("0.001"))),
+    "мл": (("л", Decimal(1000)), ("мл", Decimal(1))),
+}
+METRIC_UNITS = {display for steps in DISPLAY_UNITS.values() for display, _ in steps}
+
+CENTS = Decimal("0.01")
+
+# Строка списка покупок для вывода.
+ShoppingItem = namedtuple("ShoppingItem", ("name", "amount", "measurement_unit"))
+
+
+def canonical_unit(field):
+    """Выражение SQL: основная единица для единицы измерения в поле field."""
+    return Case(
+        *(
+            When(**{field: unit}, then=Value(canonical))
+            for unit, (canonical, _) in UNITS.items()
+        ),
+        default=F(field),
+        output_field=CharField(),
+    )
+
+
+def unit_factor(field):
+    """Выражение SQL: множитель перевода единицы из поля field в основную."""
+    return Case(
+        *(
+            When(**{field: unit}, then=Value(factor))
+            for unit, (_, factor) in UNITS.items()
+        ),
+        default=Value(Decimal(1)),
+        output_field=DecimalField(max_digits=10, decimal_places=3),
+    )
+
+
+def humanize(total, unit):
+    """
+    Количество total в основной единице unit в самой крупной единице
+    вывода, в которой оно не меньше единицы: 1500 г - 1.50 кг.
+    """
+    steps = DISPLAY_UNITS.get(unit, ((unit, Decimal(1)),))
+    display, factor = next(
+        ((display, factor) for display, factor in steps if total >= factor),
+        steps[-1],
+    )
+    return (total / factor).quantize(CENTS), display
+
+
+def humanize_rows(rows):
+    """
+    Строки ShoppingItem (название, количество, единица) для вывода списка
+    покупок из строк ShoppingListQuerySet.totals_for_user. Если все количества
+    ингредиента в одной бытовой единице ("ст. л.", "шт"), она сохраняется,
+    иначе сумма выводится в удобной метрической единице.
+    """
+    for name, total, unit, units, amount, source_unit in rows:
+        if units == 1 and source_unit not in METRIC_UNITS:
+            # Суммы без перевода СУБД возвращают с разной точностью (SQLite
+            # отбрасывает нули после точки), вывод одинаков для всех.
+            yield ShoppingItem(name, amount.quantize(CENTS), source_unit)
+        else:
+            yield ShoppingItem(name, *humanize(total, unit))
@@ -1,25 +1,42 @@
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
 from rest_framework.mixins import RetrieveModelMixin
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
 from users.models import User
-from users.pagination import LimitPageNumberPagination
+from users.pagination import (LimitCursorPagination,
+                              LimitPageNumberOrCursorPagination,
+                              LimitPageNumberPagination)
 
-from .filters import NameSearchFilter, RecipeFilter
-from .models import Amount, Favorite, Follow, Ingredient, Recipe, Tag, Trolley
+from .caching import CachedListMixin, RecipeFragmentMixin
+from .conditional import (conditional_response, followed_ids, last_modified,
+                          recipes_etag, set_validators)
+from .filters import (IngredientSearchFilter, NameSearchFilter, RecipeFilter,
+                      RecipeOrderingFilter, RecipeSearchFilter)
+from .ingredient_index import ingredient_index
+from .models import (Amount, Favorite, Follow, Ingredient, Recipe,
+                     ShoppingList, Tag, TagRecipe, TimelineEntry, Trolley,
+                     change_counter)
+from .pantry_index import pantry_index
+from .pdf import PdfUnavailableError
 from .permissions import (AdminOrReadOnly, AuthorOrAdminUserPermission,
                           EditAccessOrReadOnly, RegistrationUserPermission)
+from .renderers import SHOPPING_CART_RENDERERS
 from .serializers import (FavoriteSerializer, FollowEditSerializer,
                           IngredientSerializer, RecipeSaveSerializer,
-                          RecipeSerializer, TagSerializer, UseridSerializer)
+                          RecipeSerializer, ShoppingListSerializer,
+                          TagSerializer, UseridSerializer)
+from .similarity import similarity_index
+from .units import humanize_rows
 
 
 class UsersViewSet(GenericViewSet, RetrieveModelMixin):
@@ -47,7 +64,8 @@ class PostDeletGetID:
         return self.kwargs[self.lookup_field]
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CachedListMixin, ModelViewSet):
+    cache_name = "tags"
     permission_classes = (AdminOrReadOnly,)
     filter_backends = (SearchFilter,)
     search_fields = ("=name",)
@@ -58,29 +76,56 @@ class TagViewSet(ModelViewSet):
     pagination_class = None
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(CachedListMixin, ModelViewSet):
+    cache_name = "ingredients"
     permission_classes = (AdminOrReadOnly,)
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
-    filter_backends = (NameSearchFilter,)
+    filter_backends = (NameSearchFilter, IngredientSearchFilter)
     pagination_class = None
     lookup_value_regex = r"\d+"
     lookup_field = "id"
     search_fields = ("$name",)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(NameSearchFilter.search_param, "")
+        name = name.strip()
+        if name and settings.INGREDIENT_INDEX_ENABLED:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
 class SubscribeViewSet(GenericViewSet, PostDeletGetID):
     permission_classes = (EditAccessOrReadOnly,)
     serializer_class = FollowEditSerializer
     lookup_value_regex = r"\d+"
     lookup_field = "id"
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitPageNumberOrCursorPagination
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
             return User.objects.filter(following__user=self.request.user)
         return User.objects.all()
 
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get("recipes_limit", "")
+        limit = "".join(char for char in limit if char in "0123456789")
+        if limit:
+            return int(limit)
+        return None
+
+    def with_recipes(self, queryset):
+        """
+        Предзагружает не более recipes_limit последних рецептов каждого
+        автора. Число рецептов хранится в счётчике User.recipes_count.
+        """
+        return queryset.prefetch_related(
+            Prefetch(
+                "recipes",
+                queryset=Recipe.objects.latest_by_author(self.get_recipes_limit()),
+            )
+        )
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated],
@@ -89,7 +134,7 @@ class SubscribeViewSet(GenericViewSet, PostDeletGetID):
         url_name="subscriptions",
     )
     def follow_list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.with_recipes(self.filter_queryset(self.get_queryset()))
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
@@ -101,6 +146,7 @@ class SubscribeViewSet(GenericViewSet, PostDeletGetID):
         url_path="subscribe",
         url_name="subscribe",
     )
+    @transaction.atomic
     def follow(self, request, *args, **kwargs):
         """Добавление и удаление подписки на пользователя"""
         author = get_object_or_404(User, pk=self.get_id())
@@ -116,7 +162,10 @@ class SubscribeViewSet(GenericViewSet, PostDeletGetID):
                 return Response(
                     {"errors": "Ошибка подписки"}, status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = self.get_serializer(instance.author)
+            change_counter(User.objects.filter(pk=author.pk), "followers_count", 1)
+            TimelineEntry.objects.follow(request.user, author)
+            author = self.with_recipes(User.objects.filter(pk=author.pk)).get()
+            serializer = self.get_serializer(author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == "DELETE":
             instance = Follow.objects.filter(user=self.request.user, author=author)
@@ -125,18 +174,293 @@ class SubscribeViewSet(GenericViewSet, PostDeletGetID):
                     {"errors": "Ошибка отписки"}, status=status.HTTP_400_BAD_REQUEST
                 )
             instance.delete()
+            change_counter(User.objects.filter(pk=author.pk), "followers_count", -1)
+            TimelineEntry.objects.unfollow(request.user, author)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class RecipeViewSet(ModelViewSet, PostDeletGetID):
-    filter_backends = (RecipeFilter,)
+USER_FLAGS = ("is_favorited", "is_in_shopping_cart")
+BATCH_IDS_ERROR = "Укажите в ids от 1 до {limit} id рецептов через запятую."
+BULK_IDS_ERROR = "Передайте в ids список от 1 до {limit} id рецептов."
+SIMILAR_UNAVAILABLE_ERROR = "Похожие рецепты недоступны: не установлены numpy и scipy."
+PANTRY_IDS_ERROR = "Передайте в ingredients список от 1 до {limit} id ингредиентов."
+
+
+def clean_ids(values, limit=None):
+    """
+    id из values без повторов в порядке следования. None, если id нет, их
+    больше limit (по умолчанию RECIPE_BATCH_LIMIT) или среди них есть не
+    числа.
+    """
+    if limit is None:
+        limit = settings.RECIPE_BATCH_LIMIT
+    values = [str(value).strip() for value in values]
+    values = [value for value in values if value]
+    if not all(value.isdigit() for value in values):
+        return None
+    ids = list(dict.fromkeys(int(value) for value in values))
+    if not 0 < len(ids) <= limit:
+        return None
+    return ids
+
+
+class RecipeViewSet(RecipeFragmentMixin, ModelViewSet, PostDeletGetID):
+    filter_backends = (RecipeFilter, RecipeSearchFilter, RecipeOrderingFilter)
     permission_classes = (EditAccessOrReadOnly,)
     serializer_class = RecipeSerializer
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitPageNumberOrCursorPagination
     lookup_value_regex = r"\d+"
     lookup_field = "id"
-    queryset = Recipe.objects.prefetch_related("selected", "trolley", "author", "tags")
+    queryset = Recipe.objects.select_related("author")
+    # Действия, которые сериализуют рецепты через serialize_recipes.
+    read_actions = ("list", "retrieve", "batch", "feed", "pantry", "similar")
+
+    def get_selected_fields(self):
+        """Поля рецепта, выбранные ?fields= и ?omit=, или None - все поля."""
+        return self.get_serializer_class().selected_fields(self.request)
+
+    def get_fields_key(self):
+        """Выбранные поля строкой для ключей кэша и ETag."""
+        selected = self.get_selected_fields()
+        return "*" if selected is None else ",".join(sorted(selected))
+
+    def is_selected(self, name):
+        selected = self.get_selected_fields()
+        return selected is None or name in selected
+
+    def get_prefetches(self):
+        prefetches = []
+        if self.is_selected("tags"):
+            prefetches.append(
+                Prefetch(
+                    "tags",
+                    queryset=TagRecipe.objects.select_related("tag").order_by(
+                        "tag__name"
+                    ),
+                )
+            )
+        if self.is_selected("ingredients"):
+            prefetches.append(
+                Prefetch(
+                    "ingredients",
+                    queryset=Amount.objects.select_related("ingredient").order_by(
+                        "ingredient__name"
+                    ),
+                )
+            )
+        return prefetches
+
+    def get_queryset(self):
+        if self.action not in self.read_actions:
+            return (
+                super()
+                .get_queryset()
+                .with_user_flags(self.request.user)
+                .prefetch_related(*self.get_prefetches())
+            )
+        # Тэги и ингредиенты загружаются после проверки условного запроса,
+        # данные для полей, не выбранных ?fields= и ?omit=, не загружаются.
+        queryset = super().get_queryset().with_user_flags(
+            self.request.user,
+            [flag for flag in USER_FLAGS if self.is_selected(flag)],
+        )
+        if not self.is_selected("author"):
+            queryset = queryset.select_related(None)
+        if self.is_selected("text"):
+            return queryset
+        return queryset.defer("text")
+
+    def get_followed_ids(self):
+        """
+        Подписки пользователя: нужны для ETag и передаются в контекст
+        сериализатора, чтобы не запрашивать их второй раз. Без поля author
+        подписки не нужны.
+        """
+        if not hasattr(self, "followed_ids"):
+            if self.is_selected("author"):
+                self.followed_ids = followed_ids(self.request.user)
+            else:
+                self.followed_ids = set()
+        return self.followed_ids
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if hasattr(self, "followed_ids"):
+            context["followed_ids"] = self.followed_ids
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Рецепт с ETag и Last-Modified. Актуальность проверяется по основному
+        запросу рецепта, до загрузки тэгов, ингредиентов и сериализации.
+        """
+        instance = self.get_object()
+        etag = recipes_etag(
+            request.user,
+            (instance,),
+            self.get_followed_ids(),
+            self.get_fields_key(),
+        )
+        modified = last_modified(request.user, instance)
+        not_modified = conditional_response(request, etag, modified)
+        if not_modified is not None:
+            return set_validators(not_modified, etag, modified)
+        data = self.serialize_recipes((instance,))[0]
+        return set_validators(Response(data), etag, modified)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов с ETag по рецептам страницы и данным пагинации,
+        ответ 304 возвращается до загрузки тэгов, ингредиентов и сериализации.
+        Рецепты сериализуются через кэш общих частей, см. serialize_recipes.
+        """
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag = recipes_etag(
+            request.user,
+            page,
+            self.get_followed_ids(),
+            request.get_full_path(),
+            self.get_paginated_response([]).data,
+        )
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return set_validators(not_modified, etag)
+        data = self.serialize_recipes(page)
+        return set_validators(self.get_paginated_response(data), etag)
+
+    def get_batch_ids(self):
+        """id рецептов из ?ids=1,2,3 (или повторяющегося ids), см. clean_ids."""
+        return clean_ids(",".join(self.request.query_params.getlist("ids")).split(","))
+
+    @action(detail=False, methods=["GET"])
+    def batch(self, request, *args, **kwargs):
+        """
+        Рецепты по списку id одним ответом и фиксированным числом запросов:
+        results в порядке запроса, missing - id ненайденных рецептов.
+        Поддерживаются ?fields=, ?omit= и ETag, как у списка рецептов.
+        """
+        ids = self.get_batch_ids()
+        if ids is None:
+            return Response(
+                {"errors": BATCH_IDS_ERROR.format(limit=settings.RECIPE_BATCH_LIMIT)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        found = self.get_queryset().in_bulk(ids)
+        recipes = [found[pk] for pk in ids if pk in found]
+        etag = recipes_etag(
+            request.user, recipes, self.get_followed_ids(), request.get_full_path()
+        )
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return set_validators(not_modified, etag)
+        data = {
+            "results": self.serialize_recipes(recipes),
+            "missing": [pk for pk in ids if pk not in found],
+        }
+        return set_validators(Response(data), etag)
+
+    @action(detail=False, methods=["GET"], permission_classes=[IsAuthenticated])
+    def feed(self, request, *args, **kwargs):
+        """
+        Рецепты авторов из подписок, сначала новые, с курсорной пагинацией
+        (?cursor=, ?limit=). Поддерживаются ?fields=, ?omit= и ETag.
+        """
+        paginator = LimitCursorPagination()
+        page = paginator.paginate_queryset(
+            self.get_queryset().feed(request.user), request
+        )
+        etag = recipes_etag(
+            request.user,
+            page,
+            self.get_followed_ids(),
+            request.get_full_path(),
+            paginator.get_paginated_response([]).data,
+        )
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return set_validators(not_modified, etag)
+        data = self.serialize_recipes(page)
+        return set_validators(paginator.get_paginated_response(data), etag)
+
+    def get_results_limit(self, maximum):
+        """Число рецептов в ответе из ?limit=, не больше maximum."""
+        limit = self.request.query_params.get("limit", "")
+        if limit.isdigit() and int(limit) > 0:
+            return min(int(limit), maximum)
+        return maximum
+
+    @action(detail=False, methods=["POST"], permission_classes=[AllowAny])
+    def pantry(self, request, *args, **kwargs):
+        """
+        Что приготовить из продуктов: ingredients - список id ингредиентов в
+        наличии. Рецепты идут по убыванию покрытия (coverage) - доли
+        ингредиентов рецепта, которые есть в наличии, в missing перечислены
+        недостающие. Рецепты подбираются по обратному индексу в памяти, без
+        группировки строк Amount в запросе к БД.
+        """
+        values = self.get_body_list("ingredients")
+        limit = settings.PANTRY_INGREDIENTS_LIMIT
+        ids = None if values is None else clean_ids(values, limit)
+        if ids is None:
+            return Response(
+                {"errors": PANTRY_IDS_ERROR.format(limit=limit)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        found = pantry_index.search(
+            ids, self.get_results_limit(settings.PANTRY_RESULTS_LIMIT)
+        )
+        recipes = self.get_queryset().in_bulk([pk for pk, _, _ in found])
+        # Рецепт мог быть удалён в другом процессе до обновления индекса.
+        found = [item for item in found if item[0] in recipes]
+        ingredients = Ingredient.objects.in_bulk(
+            {pk for _, _, missing in found for pk in missing}
+        )
+        data = self.serialize_recipes([recipes[pk] for pk, _, _ in found])
+        for recipe, (_, coverage, missing) in zip(data, found):
+            recipe["coverage"] = round(coverage, 4)
+            recipe["missing"] = IngredientSerializer(
+                [ingredients[pk] for pk in missing], many=True
+            ).data
+        return Response({"results": data})
+
+    @action(detail=True, methods=["GET"])
+    def similar(self, request, *args, **kwargs):
+        """
+        Рецепты, похожие на данный по ингредиентам и тэгам, по убыванию
+        косинусной близости (similarity). Близость считается по матрице
+        признаков в памяти, см. api.similarity.
+        """
+        if not similarity_index.is_available():
+            return Response(
+                {"errors": SIMILAR_UNAVAILABLE_ERROR},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        instance = self.get_object()
+        found = similarity_index.similar(
+            instance.pk, self.get_results_limit(settings.SIMILAR_RESULTS_LIMIT)
+        )
+        recipes = self.get_queryset().in_bulk([pk for pk, _ in found])
+        found = [(pk, score) for pk, score in found if pk in recipes]
+        data = self.serialize_recipes([recipes[pk] for pk, _ in found])
+        for recipe, (_, score) in zip(data, found):
+            recipe["similarity"] = round(score, 4)
+        return Response({"results": data})
+
+    def refresh_instance(self, serializer):
+        """
+        Перечитывает сохранённый рецепт через get_queryset, чтобы ответ
+        строился по предзагруженным тэгам и ингредиентам.
+        """
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.refresh_instance(serializer)
 
     def get_serializer_class(self):
         if self.request.method == SAFE_METHODS:
@@ -145,29 +469,72 @@ class RecipeViewSet(ModelViewSet, PostDeletGetID):
             return RecipeSaveSerializer
 
     @action(
-        detail=False, permission_classes=[AuthorOrAdminUserPermission], methods=["GET"]
+        detail=False,
+        permission_classes=[AuthorOrAdminUserPermission],
+        methods=["GET"],
+        renderer_classes=SHOPPING_CART_RENDERERS,
     )
     def download_shopping_cart(self, request, *args, **kwargs):
-        shopping_cart = ["Список необходимых покупок:"]
-        ingredients_list = (
-            Amount.objects.filter(recipe__trolley__user=self.request.user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
-            .order_by("ingredient__name")
-            .values_list("ingredient__name", "amount", "ingredient__measurement_unit")
-        )
-        for pos, (key, value, unit) in enumerate(ingredients_list[1:]):
-            shopping_cart.append(f"{pos}: {key}, {value} {unit}")
-        return FileResponse(
-            "\n".join(shopping_cart),
-            as_attachment=True,
-            filename="shopping_cart.txt",
+        """
+        Выгрузка списка покупок в формате txt, csv, json или pdf. Количества
+        одного ингредиента в разных единицах складываются в SQL, строки
+        читаются курсором на стороне сервера и отдаются потоком.
+        """
+        renderer = request.accepted_renderer
+        rows = humanize_rows(
+            ShoppingList.objects.totals_for_user(request.user).iterator(
+                chunk_size=2000
+            )
+        )
+        try:
+            content = renderer.exporter(rows)
+        except PdfUnavailableError as error:
+            return Response(
+                {"errors": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        response = StreamingHttpResponse(
+            content,
             status=status.HTTP_200_OK,
-            content_type="text/plain",
+            content_type=renderer.get_content_type(),
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
         )
+        return response
 
-    def post_delete(self, request, target):
+    @action(
+        detail=False,
+        permission_classes=[AuthorOrAdminUserPermission],
+        methods=["GET"],
+    )
+    def shopping_list(self, request, *args, **kwargs):
+        """
+        Суммарный список покупок по рецептам из корзины, с переводом единиц
+        как в download_shopping_cart.
+        """
+        rows = humanize_rows(ShoppingList.objects.totals_for_user(request.user))
+        serializer = ShoppingListSerializer(rows, many=True)
+        return Response(serializer.data)
+
+    @staticmethod
+    def lock_user(user):
+        """
+        Блокирует строку пользователя до конца транзакции. Одиночные и
+        пакетные изменения избранного и корзины пользователя выполняются по
+        очереди: иначе оба запроса увидят рецепт не добавленным и дважды
+        изменят счётчики и список покупок.
+        """
+        User.objects.select_for_update().get(pk=user.pk)
+
+    @transaction.atomic
+    def post_delete(self, request, target, counter, on_change=None):
+        """
+        Добавление и удаление рецепта в модель target, counter - счётчик
+        связей в рецепте. Функция on_change вызывается с (пользователь,
+        рецепт, 1 или -1) при изменении связи.
+        """
         obj = get_object_or_404(Recipe, pk=self.get_id())
+        self.lock_user(request.user)
         if request.method == "POST":
             instance, created = target.objects.get_or_create(
                 user=request.user, recipe=obj
@@ -176,13 +543,89 @@ class RecipeViewSet(ModelViewSet, PostDeletGetID):
                 return Response(
                     {"errors": "Ошибка подписки"}, status=status.HTTP_400_BAD_REQUEST
                 )
+            change_counter(Recipe.objects.filter(pk=obj.pk), counter, 1)
+            if on_change:
+                on_change(request.user, obj, 1)
             serializer = FavoriteSerializer(obj)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == "DELETE":
-            target.objects.filter(user=request.user, recipe=obj).delete()
+            deleted, _ = target.objects.filter(user=request.user, recipe=obj).delete()
+            if deleted:
+                change_counter(Recipe.objects.filter(pk=obj.pk), counter, -1)
+            if deleted and on_change:
+                on_change(request.user, obj, -1)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+    def get_body_list(self, name):
+        """Список name из тела запроса (JSON или форма), иначе None."""
+        data = self.request.data
+        if hasattr(data, "getlist"):
+            return data.getlist(name)
+        if isinstance(data, dict) and isinstance(data.get(name), list):
+            return data[name]
+        return None
+
+    def get_bulk_ids(self):
+        """
+        id рецептов из списка ids в теле запроса. Для DELETE без тела id
+        можно передать и в ?ids=, как в batch.
+        """
+        values = self.get_body_list("ids")
+        if not values and self.request.method == "DELETE":
+            return self.get_batch_ids()
+        if values is None:
+            return None
+        return clean_ids(values)
+
+    @transaction.atomic
+    def bulk_post_delete(self, request, target, counter, on_change=None):
+        """
+        Добавление и удаление списка рецептов в модель target: одна запись
+        пачкой через bulk_create или одно удаление вместо запроса на каждый
+        рецепт, counter - счётчик связей в рецепте. Функция on_change
+        вызывается с (пользователь, id изменённых рецептов, 1 или -1).
+        Возвращает результат по каждому id: added, exists, deleted, absent
+        или not_found.
+        """
+        ids = self.get_bulk_ids()
+        if ids is None:
+            return Response(
+                {"errors": BULK_IDS_ERROR.format(limit=settings.RECIPE_BATCH_LIMIT)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        user = request.user
+        self.lock_user(user)
+        linked = dict(
+            Recipe.objects.filter(pk__in=ids)
+            .annotate(
+                linked=Exists(target.objects.filter(user=user, recipe=OuterRef("pk")))
+            )
+            .values_list("pk", "linked")
+        )
+        if request.method == "POST":
+            changed = [pk for pk in ids if linked.get(pk) is False]
+            target.objects.bulk_create(
+                [target(user=user, recipe_id=pk) for pk in changed],
+                ignore_conflicts=True,
+            )
+            done, skipped, sign = "added", "exists", 1
+        else:
+            changed = [pk for pk in ids if linked.get(pk)]
+            if changed:
+                target.objects.filter(user=user, recipe__in=changed).delete()
+            done, skipped, sign = "deleted", "absent", -1
+        if changed:
+            change_counter(Recipe.objects.filter(pk__in=changed), counter, sign)
+        if changed and on_change:
+            on_change(user, changed, sign)
+        statuses = dict.fromkeys(ids, "not_found")
+        statuses.update(dict.fromkeys(linked, skipped))
+        statuses.update(dict.fromkeys(changed, done))
+        return Response(
+            {"results": [{"id": pk, "status": statuses[pk]} for pk in ids]}
+        )
+
     @action(
         detail=True,
         permission_classes=[AuthorOrAdminUserPermission],
@@ -190,7 +633,7 @@ class RecipeViewSet(ModelViewSet, PostDeletGetID):
     )
     def favorite(self, request, *args, **kwargs):
         """Добавление и удаление из избранных"""
-        return self.post_delete(request, Favorite)
+        return self.post_delete(request, Favorite, "favorites_count")
 
     @action(
         detail=True,
@@ -199,4 +642,28 @@ class RecipeViewSet(ModelViewSet, PostDeletGetID):
     )
     def shopping_cart(self, request, *args, **kwargs):
         """Добавление и удаление из корзины"""
-        return self.post_delete(request, Trolley)
+        return self.post_delete(
+            request, Trolley, "carts_count", ShoppingList.objects.add_recipe
+        )
+
+    @action(
+        detail=False,
+        permission_classes=[AuthorOrAdminUserPermission],
+        methods=["POST", "DELETE"],
+        url_path="favorite/bulk",
+    )
+    def favorite_bulk(self, request, *args, **kwargs):
+        """Добавление и удаление списка рецептов из избранных"""
+        return self.bulk_post_delete(request, Favorite, "favorites_count")
+
+    @action(
+        detail=False,
+        permission_classes=[AuthorOrAdminUserPermission],
+        methods=["POST", "DELETE"],
+        url_path="shopping_cart/bulk",
+    )
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        """Добавление и удаление списка рецептов из корзины"""
+        return self.bulk_post_delete(
+            request, Trolley, "carts_count", ShoppingList.objects.add_recipes
+        )
@@ -117,6 +117,15 @@ REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
 }
 
+# JSON ответов и запросов через orjson (api.renderers.FastJSONRenderer).
+if os.getenv("FAST_JSON", "1") == "1":
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = ("api.renderers.FastJSONRenderer",)
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] = (
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    )
+
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "static"
 
@@ -127,6 +136,71 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MIN_WIDTH, MIN_HEIGHT = 480, 169
 
+# Шрифт TrueType с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    "SHOPPING_CART_PDF_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+
+# По умолчанию кэш в памяти процесса, бэкенд задаётся переменными окружения.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Кэш списков тэгов и ингредиентов: алиас из CACHES и время жизни ответа.
+REFERENCE_CACHE_ALIAS = os.getenv("REFERENCE_CACHE_ALIAS", "default")
+REFERENCE_CACHE_TIMEOUT = int(os.getenv("REFERENCE_CACHE_TIMEOUT", 60))
+
+# Кэш общих для всех пользователей данных рецептов: алиас и время жизни.
+RECIPE_CACHE_ALIAS = os.getenv("RECIPE_CACHE_ALIAS", "default")
+RECIPE_CACHE_TIMEOUT = int(os.getenv("RECIPE_CACHE_TIMEOUT", 600))
+
+# Наибольшее число рецептов в одном запросе /api/recipes/batch/?ids=.
+RECIPE_BATCH_LIMIT = int(os.getenv("RECIPE_BATCH_LIMIT", 100))
+
+# Лента /api/recipes/feed/: рецепты авторов, у которых подписчиков не больше
+# FEED_FANOUT_LIMIT, рассылаются по лентам при публикации, рецепты остальных
+# авторов лента читает из подписок.
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 1000))
+
+# Популярность рецептов для ?ordering=popular: вес добавления в избранное
+# и в корзину и период, за который вес добавления убывает вдвое.
+POPULARITY_FAVORITE_WEIGHT = float(os.getenv("POPULARITY_FAVORITE_WEIGHT", 1))
+POPULARITY_CART_WEIGHT = float(os.getenv("POPULARITY_CART_WEIGHT", 2))
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", 14))
+
+# Поиск ингредиентов по ?name= через индекс в памяти процесса: максимальное
+# число результатов и период полной перестройки индекса из БД в секундах.
+INGREDIENT_INDEX_ENABLED = os.getenv("INGREDIENT_INDEX_ENABLED", "1") == "1"
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 50))
+INGREDIENT_INDEX_TTL = int(os.getenv("INGREDIENT_INDEX_TTL", 300))
+
+# Поиск рецептов по продуктам /api/recipes/pantry/: наибольшее число
+# продуктов в запросе и рецептов в ответе, период полной перестройки
+# индекса из БД в секундах.
+PANTRY_INGREDIENTS_LIMIT = int(os.getenv("PANTRY_INGREDIENTS_LIMIT", 100))
+PANTRY_RESULTS_LIMIT = int(os.getenv("PANTRY_RESULTS_LIMIT", 20))
+PANTRY_INDEX_TTL = int(os.getenv("PANTRY_INDEX_TTL", 300))
+
+# Похожие рецепты /api/recipes/{id}/similar/: вес тэга относительно
+# ингредиента, наибольшее число рецептов в ответе, файл матрицы признаков,
+# который пишет команда build_similarity, и период полной перестройки
+# матрицы из БД в секундах (новый файл загружается при ней же).
+SIMILAR_TAG_WEIGHT = float(os.getenv("SIMILAR_TAG_WEIGHT", 0.5))
+SIMILAR_RESULTS_LIMIT = int(os.getenv("SIMILAR_RESULTS_LIMIT", 10))
+SIMILAR_MATRIX_PATH = os.getenv(
+    "SIMILAR_MATRIX_PATH", os.path.join(BASE_DIR, "similarity.npz")
+)
+SIMILAR_INDEX_TTL = int(os.getenv("SIMILAR_INDEX_TTL", 300))
+
+# Построение индексов в памяти (api.memory_index) при запуске процесса в
+# wsgi.py, а не при первом запросе.
+INDEX_PRELOAD = os.getenv("INDEX_PRELOAD", "1") == "1"
+
 if DEBUG:
     EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
     EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
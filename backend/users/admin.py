@@ -6,7 +6,15 @@ EMPTY = "-пусто-"
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ("pk", "username", "email", "first_name", "last_name")
+    list_display = (
+        "pk",
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "recipes_count",
+        "followers_count",
+    )
     search_fields = ("username", "email", "first_name", "last_name")
     empty_value_display = EMPTY
 
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 from .managers import CustomUserManager
@@ -14,6 +15,15 @@ class User(AbstractUser):
         "last_name",
     )
 
+    # Счётчики поддерживаются api при изменениях рецептов и подписок,
+    # расхождения исправляет команда recount.
+    recipes_count = models.PositiveIntegerField(
+        verbose_name=_("Число рецептов"), default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name=_("Число подписчиков"), default=0, editable=False
+    )
+
     objects = CustomUserManager()
 
     class Meta:
@@ -1,4 +1,6 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPageNumberPagination(PageNumberPagination):
@@ -13,3 +15,54 @@ class LimitPageNumberPagination(PageNumberPagination):
     page_query_param = "page"
     page_size_query_param = "limit"
     max_page_size = 100
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    A cursor based style keyed on the primary key. Pages are fetched with
+    "WHERE pk < position LIMIT limit" so deep pages cost the same as the
+    first one. For example:
+
+    http://api.example.org/recipes/?cursor=
+    http://api.example.org/recipes/?cursor=cD0xMjM%3D&limit=100
+    """
+
+    page_size_query_param = "limit"
+    max_page_size = 100
+    ordering = "-pk"
+
+
+class LimitPageNumberOrCursorPagination(LimitPageNumberPagination):
+    """
+    Page number pagination with an opt-in cursor mode. The cursor mode is
+    selected by the presence of the cursor query parameter and skips the
+    COUNT(*) query unless count is requested. For example:
+
+    http://api.example.org/recipes/?page=4&limit=100
+    http://api.example.org/recipes/?cursor=&limit=100
+    http://api.example.org/recipes/?cursor=cD0xMjM%3D&limit=100&count=1
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    cursor_pagination_class = LimitCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.cursor_paginator = None
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = self.cursor_pagination_class()
+        self.cursor_count = None
+        if request.query_params.get(self.count_query_param, "0") != "0":
+            self.cursor_count = queryset.count()
+        return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is None:
+            return super().get_paginated_response(data)
+        response = self.cursor_paginator.get_paginated_response(data)
+        if self.cursor_count is not None:
+            response.data = OrderedDict(
+                (("count", self.cursor_count), *response.data.items())
+            )
+        return response